@@ -0,0 +1,69 @@
+import os
+import numpy as np
+from packed_rolls import PackedRolls
+from sparse_rolls import SparseRolls
+from note_events import window_starts
+
+"""
+Training batches read straight from memory mapped roll files. Nothing is
+loaded or shuffled up front: each epoch draws a permutation of row numbers and
+every batch reads just its rows from disk, converted to float32 on the way, so
+a dataset larger than RAM trains the same as one that fits.
+"""
+
+def load_rolls(name, mmap_mode='r'):
+	# name_coo_*.npy (SparseRolls), name.npy with name_shape.npy (PackedRolls) or a plain dense name.npy
+	if os.path.exists(name + '_coo_offsets.npy'):
+		return SparseRolls.load(name + '_coo', mmap_mode)
+	if os.path.exists(name + '_shape.npy'):
+		return PackedRolls.load(name, mmap_mode)
+	return np.load(name + '.npy', mmap_mode=mmap_mode)
+
+def read_rows(data, inds):
+	# data[inds] as float32, read in file order and put back in the order of inds
+	inds = np.asarray(inds, dtype=np.int64)
+	order = np.argsort(inds, kind='stable')
+	batch = np.empty((len(inds),) + tuple(data.shape[1:]), dtype=np.float32)
+	batch[order] = data[inds[order]]
+	return batch
+
+def iter_batches(data, labels, batch_size, inds=None, epochs=None, rng=np.random):
+	"""
+	Yields shuffled (batch_x, batch_y) from the rows inds of data (all of them by
+	default), a new permutation every epoch, forever unless epochs is given.
+	A final partial batch is dropped.
+	"""
+	if inds is None:
+		inds = np.arange(len(data))
+	epoch = 0
+	while epochs is None or epoch < epochs:
+		perm = inds[rng.permutation(len(inds))]
+		for start in range(0, len(perm) - batch_size + 1, batch_size):
+			batch_inds = perm[start:start+batch_size]
+			yield read_rows(data, batch_inds), labels[batch_inds]
+		epoch += 1
+
+def iter_windows(rolls, roll_offsets, labels, batch_size, steps_per_window, stride, roll_inds=None, epochs=None, rng=np.random):
+	"""
+	Yields shuffled (batch_x, batch_y) windows of whole score rolls laid end to
+	end (encode_rolls.py's rolls.npy and roll_offsets.npy), every window of the
+	rolls roll_inds (all of them by default) once an epoch, labels being per roll.
+	Only the batch's windows are read from rolls, as float32.
+	"""
+	window_rolls, starts = window_starts(roll_offsets, steps_per_window, stride)
+	if roll_inds is not None:
+		keep = np.isin(window_rolls, roll_inds)
+		window_rolls, starts = window_rolls[keep], starts[keep]
+	epoch = 0
+	while epochs is None or epoch < epochs:
+		perm = rng.permutation(len(starts))
+		for start in range(0, len(perm) - batch_size + 1, batch_size):
+			batch_inds = perm[start:start+batch_size]
+			batch_starts = starts[batch_inds]
+			# one read per window, in file order
+			order = np.argsort(batch_starts, kind='stable')
+			batch = np.empty((batch_size, steps_per_window) + tuple(rolls.shape[1:]), dtype=np.float32)
+			for i in order:
+				batch[i] = rolls[batch_starts[i]:batch_starts[i]+steps_per_window]
+			yield batch, labels[window_rolls[batch_inds]]
+		epoch += 1
@@ -0,0 +1,93 @@
+import os
+import pickle
+
+"""
+Manifest for incremental, resumable create_dataset.py builds.
+The manifest maps each source score to the hash of its file, the config it was
+processed with and the outputs (score_to_stats names) it produced. Finished
+scores are appended to a journal as they complete, so a crashed build replays
+the journal and carries on instead of starting over. checkpoint() folds the
+journal into the manifest; every file is replaced atomically.
+"""
+
+def atomic_dump(obj, path):
+	tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+	with open(tmp_path, 'wb') as f:
+		pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp_path, path)
+
+def load_pickle(path, default=None):
+	if not os.path.exists(path):
+		return default
+	with open(path, 'rb') as f:
+		return pickle.load(f)
+
+class BuildManifest(object):
+	def __init__(self, path, config):
+		self.path = path
+		self.journal_path = path + '.journal'
+		self.config = config
+		self.entries = load_pickle(path, {})
+		self.journal = None
+
+	def replay(self):
+		# results journaled since the last checkpoint, oldest first; a torn final record is dropped
+		results = []
+		if not os.path.exists(self.journal_path):
+			return results
+		with open(self.journal_path, 'rb') as f:
+			while True:
+				try:
+					results.append(pickle.load(f))
+				except (EOFError, pickle.UnpicklingError, ValueError):
+					break
+		return results
+
+	def is_current(self, source, file_hash):
+		entry = self.entries.get(source)
+		return entry is not None and entry['hash'] == file_hash and entry['config'] == self.config
+
+	def outputs(self, source):
+		if source in self.entries:
+			return self.entries[source]['outputs']
+		return []
+
+	def sources(self):
+		return set(self.entries)
+
+	def update(self, source, file_hash, outputs, parse_error=False):
+		self.entries[source] = {
+			'hash': file_hash,
+			'config': self.config,
+			'outputs': outputs,
+			'parse_error': parse_error
+		}
+
+	def remove(self, source):
+		self.entries.pop(source, None)
+
+	def record(self, result):
+		if self.journal is None:
+			self.journal = open(self.journal_path, 'ab')
+		pickle.dump(result, self.journal, protocol=pickle.HIGHEST_PROTOCOL)
+		self.journal.flush()
+		os.fsync(self.journal.fileno())
+
+	def checkpoint(self, dumps=()):
+		# write the merged outputs first, so a crash before the manifest lands just replays the journal again
+		for obj, path in dumps:
+			atomic_dump(obj, path)
+		atomic_dump(self.entries, self.path)
+		if self.journal is not None:
+			self.journal.close()
+			self.journal = None
+		if os.path.exists(self.journal_path):
+			os.remove(self.journal_path)
+
+def remove_outputs(score_to_stats, cumulative_score_stats, names):
+	for name in names:
+		score_stats = score_to_stats.pop(name, None)
+		if score_stats is not None:
+			cumulative_score_stats.remove(name, score_stats)
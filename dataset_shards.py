@@ -0,0 +1,149 @@
+import os
+import numpy as np
+from build_manifest import atomic_dump, load_pickle
+from sparse_rolls import SparseRolls, roll_cells
+from packed_rolls import PackedRolls, pack_rolls
+from batch_reader import load_rolls
+
+"""
+Encoded dataset written as fixed size shards plus an index, instead of one
+X.npy lined up with the split pickles by position. Each shard holds up to
+shard_size cuts, in the SparseRolls format or, with storage='packed', as
+PackedRolls (1 bit per cell, 2 for onset/sustain rolls), which is smaller for
+dense rolls and reads at a fixed cost per roll; index.p maps every cut name to
+its shard and row, its split and its label. A shard and the index entries for it
+are only written once the shard is full (or the writer is closed), so a
+crashed encode picks up after the last shard it finished. Splits and labels
+are set again from the current partitions on every encode (ShardWriter.assign),
+so a re-split moves cuts between splits without encoding them again.
+"""
+SHARD_SIZE = 4096
+INDEX_FILE = 'index.p'
+STORAGES = ('sparse', 'packed')
+
+def shard_name(shard_dir, shard):
+	return os.path.join(shard_dir, 'shard_{:05d}'.format(shard))
+
+def empty_index(roll_shape, shard_size, storage):
+	return {
+		'roll_shape': tuple(roll_shape),
+		'shard_size': shard_size,
+		'storage': storage,
+		'shard_lengths': [],
+		'names': [],
+		'shards': [],
+		'rows': [],
+		'splits': [],
+		'labels': []
+	}
+
+class ShardWriter(object):
+	def __init__(self, shard_dir, roll_shape, shard_size=SHARD_SIZE, storage='sparse'):
+		if storage not in STORAGES:
+			raise ValueError("unknown shard storage " + storage)
+		self.shard_dir = shard_dir
+		os.makedirs(shard_dir, exist_ok=True)
+		self.index_path = os.path.join(shard_dir, INDEX_FILE)
+		self.index = load_pickle(self.index_path, empty_index(roll_shape, shard_size, storage))
+		if self.index['roll_shape'] != tuple(roll_shape):
+			raise ValueError("{} holds rolls of shape {}, not {}".format(shard_dir, self.index['roll_shape'], tuple(roll_shape)))
+		# indexes written before packed shards existed are all sparse
+		if self.index.get('storage', 'sparse') != storage:
+			raise ValueError("{} holds {} shards, not {}".format(shard_dir, self.index.get('storage', 'sparse'), storage))
+		self.storage = storage
+		self.names = set(self.index['names'])
+		self.buffer = []
+
+	def __contains__(self, name):
+		# cuts already in a finished shard are skipped when an encode is restarted
+		return name in self.names
+
+	def assign(self, partitions):
+		"""
+		Sets the split and label of every cut in a finished shard from partitions,
+		{name: (split, label)} as of the current split pickles, and drops the cuts
+		that are in none of them from the index. Their rows stay in the shard files
+		but are never read.
+		"""
+		keep = [i for i, name in enumerate(self.index['names']) if name in partitions]
+		for key in ('names', 'shards', 'rows'):
+			self.index[key] = [self.index[key][i] for i in keep]
+		self.index['splits'] = [partitions[name][0] for name in self.index['names']]
+		self.index['labels'] = [partitions[name][1] for name in self.index['names']]
+		self.names = set(self.index['names']) | set(name for name, _, _, _ in self.buffer)
+		atomic_dump(self.index, self.index_path)
+
+	def add(self, name, roll, split, label):
+		# the buffer holds each roll packed or as its cells, never dense
+		if self.storage == 'packed':
+			self.buffer.append((name, pack_rolls(np.asarray(roll)[None])[0], split, label))
+		else:
+			self.buffer.append((name, roll_cells(roll), split, label))
+		self.names.add(name)
+		if len(self.buffer) >= self.index['shard_size']:
+			self.flush()
+
+	def flush(self):
+		if not self.buffer:
+			return
+		shard = len(self.index['shard_lengths'])
+		if self.storage == 'packed':
+			rolls = PackedRolls(np.stack([packed for _, packed, _, _ in self.buffer]), self.index['roll_shape'])
+			rolls.save(shard_name(self.shard_dir, shard))
+		else:
+			rolls = SparseRolls.from_cells([cells for _, cells, _, _ in self.buffer], self.index['roll_shape'])
+			rolls.save(shard_name(self.shard_dir, shard) + '_coo')
+		for row, (name, _, split, label) in enumerate(self.buffer):
+			self.index['names'].append(name)
+			self.index['shards'].append(shard)
+			self.index['rows'].append(row)
+			self.index['splits'].append(split)
+			self.index['labels'].append(label)
+		self.index['shard_lengths'].append(len(self.buffer))
+		atomic_dump(self.index, self.index_path)
+		self.buffer = []
+
+	def close(self):
+		self.flush()
+
+class ShardedDataset(object):
+	"""
+	Every cut of a ShardWriter directory, numbered in index order. Indexing
+	reads the rows from the memory mapped shards they live in, as float32, so
+	it can stand in for an X array with batch_reader.read_rows/iter_batches.
+	"""
+	def __init__(self, shard_dir, mmap_mode='r'):
+		self.index = load_pickle(os.path.join(shard_dir, INDEX_FILE))
+		if self.index is None:
+			raise IOError("no shard index in " + shard_dir)
+		self.names = np.array(self.index['names'])
+		self.splits = np.array(self.index['splits'])
+		self.labels = np.array(self.index['labels'], dtype=np.int32)
+		self.shard_of = np.array(self.index['shards'], dtype=np.int64)
+		self.row_of = np.array(self.index['rows'], dtype=np.int64)
+		self.shards = [load_rolls(shard_name(shard_dir, shard), mmap_mode) for shard in range(len(self.index['shard_lengths']))]
+
+	@property
+	def shape(self):
+		return (len(self),) + self.index['roll_shape']
+
+	def __len__(self):
+		return len(self.names)
+
+	def split_inds(self, split):
+		return np.flatnonzero(self.splits == split)
+
+	def find(self, names):
+		lookup = dict((name, i) for i, name in enumerate(self.names))
+		return np.array([lookup[name] for name in names], dtype=np.int64)
+
+	def __getitem__(self, inds):
+		if isinstance(inds, (int, np.integer)):
+			return self[[inds]][0]
+		inds = np.arange(len(self))[inds]
+		X = np.empty((len(inds),) + self.index['roll_shape'], dtype=np.float32)
+		shards = self.shard_of[inds]
+		for shard in np.unique(shards):
+			mask = shards == shard
+			X[mask] = self.shards[shard][self.row_of[inds[mask]]]
+		return X
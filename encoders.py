@@ -0,0 +1,74 @@
+import numpy as np
+from note_events import parse_xml_events, encode_events, encode_events_sustain
+from note_events import NOTE_RANGE, GRANULARITY, XML_PARSER_VERSION
+from score_cache import cached_encoding, store_encoding
+from roll_features import roll_chroma, CHROMA
+
+"""
+Registry of cut encodings. Every encoder reads the same note event array,
+parsed once per cut file and kept in the encoding cache, so adding an
+encoding is one more vectorized pass over the notes rather than another parse
+of the corpus. An encoder is called as
+  encode(events, num_measures, steps_per_cut, granularity)
+and returns an array with time on axis 0, steps_per_cut long.
+
+Event tokens (event_tokens.py) are not an encoder: a token sequence has no
+fixed length and no time axis to pool into the pyramid levels, and the shard
+formats only store binary roll cells. Tokens are computed per batch from the
+stored rolls instead, after key augmentation, which also keeps the shards
+the same whatever the model is fed.
+"""
+ENCODERS = {}
+
+class Encoder(object):
+	def __init__(self, name, encode, frame_shape):
+		self.name = name
+		self.encode = encode
+		# shape of one time step of the encoding
+		self.frame_shape = tuple(frame_shape)
+
+	def shape(self, steps_per_cut):
+		return (steps_per_cut,) + self.frame_shape
+
+	def __call__(self, events, num_measures, steps_per_cut, granularity=GRANULARITY):
+		return self.encode(events, num_measures, steps_per_cut, granularity)
+
+def register_encoder(name, frame_shape):
+	def register(encode):
+		ENCODERS[name] = Encoder(name, encode, frame_shape)
+		return encode
+	return register
+
+CUT_EVENTS_VARIANT = 'note_events-v{}'.format(XML_PARSER_VERSION)
+
+def cached_cut_events(path):
+	# note events of a cut file, from the encoding cache when this parser version has seen the file before
+	return cached_encoding(path, CUT_EVENTS_VARIANT, lambda path: parse_xml_events(path)[0])
+
+def parse_cut_events(path):
+	# (events, meta) of a freshly written cut file, with the events cached for cached_cut_events
+	events, meta = parse_xml_events(path)
+	store_encoding(path, CUT_EVENTS_VARIANT, events)
+	return events, meta
+
+def transpose_events(events, shift):
+	# events shift semitones up; encoders drop whatever leaves MIN_PITCH..MAX_PITCH
+	if not shift:
+		return events
+	events = events.copy()
+	events['pitch'] += shift
+	return events
+
+@register_encoder('binary', (NOTE_RANGE,))
+def encode_binary(events, num_measures, steps_per_cut, granularity=GRANULARITY):
+	return encode_events(events, num_measures, steps_per_cut, granularity=granularity).astype(np.uint8)
+
+@register_encoder('onset_sustain', (NOTE_RANGE, 3))
+def encode_onset_sustain(events, num_measures, steps_per_cut, granularity=GRANULARITY):
+	return encode_events_sustain(events, num_measures, steps_per_cut, granularity=granularity).astype(np.uint8)
+
+@register_encoder('chroma', (CHROMA,))
+def encode_chroma(events, num_measures, steps_per_cut, granularity=GRANULARITY):
+	# pitch classes sounding at each step, C first
+	X = encode_events(events, num_measures, steps_per_cut, granularity=granularity)
+	return roll_chroma(X[None], dtype=np.uint8)[0]
@@ -0,0 +1,148 @@
+import numpy as np
+from note_events import NOTE_RANGE, MIN_PITCH, GRANULARITY
+from batch_reader import read_rows
+
+"""
+Cuts as sequences of event tokens instead of steps*pitches grids: a note on or
+note off token for every note edge and time shift tokens between them, so a
+sequence is as long as the cut has notes. Token 0 pads, then come the note ons
+of the NOTE_RANGE pitches, their note offs and the shifts of 1..max_shift steps.
+At one time step note offs come before note ons, pitches low to high, and a
+note still sounding at the end of the cut has no note off.
+"""
+PAD = 0
+NOTE_ON = 1
+NOTE_OFF = NOTE_ON + NOTE_RANGE
+# token of a 1 step time shift, a shift of s steps is TIME_SHIFT + s - 1
+TIME_SHIFT = NOTE_OFF + NOTE_RANGE
+# one whole note at the default granularity
+MAX_SHIFT = GRANULARITY
+VOCAB_FILE = 'vocab.txt'
+
+def vocab(max_shift=MAX_SHIFT):
+	return ['<pad>'] + ['on_{}'.format(MIN_PITCH + p) for p in range(NOTE_RANGE)] + \
+		['off_{}'.format(MIN_PITCH + p) for p in range(NOTE_RANGE)] + \
+		['shift_{}'.format(s) for s in range(1, max_shift + 1)]
+
+def write_vocab(path, max_shift=MAX_SHIFT):
+	# one token name per line, line i is token i
+	with open(path, 'w') as f:
+		f.write('\n'.join(vocab(max_shift)) + '\n')
+
+def read_vocab(path):
+	with open(path) as f:
+		return f.read().split()
+
+def vocab_max_shift(vocab):
+	return len(vocab) - TIME_SHIFT
+
+def roll_notes(X):
+	# (played, onsets) boolean (n, steps, pitches) arrays of binary or [unused, onset, sustain] rolls
+	X = np.asarray(X) != 0
+	if X.ndim == 4 and X.shape[3] == 3:
+		return X[..., 1] | X[..., 2], X[..., 1]
+	played = X.reshape(X.shape[:3])
+	prev = np.zeros_like(played)
+	prev[:, 1:] = played[:, :-1]
+	return played, played & ~prev
+
+def roll_tokens(X, max_shift=MAX_SHIFT):
+	"""
+	Event tokens of a batch of rolls as one flat int16 array and offsets, roll
+	i's tokens being tokens[offsets[i]:offsets[i+1]].
+	"""
+	played, onsets = roll_notes(X)
+	n = len(played)
+	prev = np.zeros_like(played)
+	prev[:, 1:] = played[:, :-1]
+	# a note ends where its pitch stops sounding or is struck again
+	offs = prev & (onsets | ~played)
+	off_rolls, off_steps, off_pitches = np.nonzero(offs)
+	on_rolls, on_steps, on_pitches = np.nonzero(onsets)
+	rolls = np.concatenate([off_rolls, on_rolls])
+	steps = np.concatenate([off_steps, on_steps])
+	events = np.concatenate([NOTE_OFF + off_pitches, NOTE_ON + on_pitches])
+	order = np.lexsort((events, 2*steps + (events < NOTE_OFF), rolls))
+	rolls, steps, events = rolls[order], steps[order], events[order]
+	# steps since the previous event of the same roll, or since the start of the roll
+	prev_steps = np.zeros_like(steps)
+	prev_steps[1:] = steps[:-1]
+	first = np.ones(len(rolls), dtype=bool)
+	first[1:] = rolls[1:] != rolls[:-1]
+	prev_steps[first] = 0
+	deltas = steps - prev_steps
+	num_shifts = -(-deltas // max_shift)
+	# every event takes its shifts then itself; the shifts are all max_shift but the last
+	ends = np.cumsum(num_shifts + 1)
+	tokens = np.full(ends[-1] if len(ends) else 0, TIME_SHIFT + max_shift - 1, dtype=np.int16)
+	tokens[ends - 1] = events
+	shifted = num_shifts > 0
+	tokens[ends[shifted] - 2] = TIME_SHIFT + deltas[shifted] - (num_shifts[shifted] - 1)*max_shift - 1
+	offsets = np.zeros(n + 1, dtype=np.int64)
+	offsets[1:] = np.cumsum(np.bincount(rolls, weights=num_shifts + 1, minlength=n)).astype(np.int64)
+	return tokens, offsets
+
+def tokens_roll(tokens, steps, max_shift=MAX_SHIFT, sustain=False):
+	"""
+	Inverse of roll_tokens for one sequence, padding and all: a binary
+	(steps, NOTE_RANGE) roll, or a (steps, NOTE_RANGE, 3) onset/sustain roll.
+	"""
+	tokens = np.asarray(tokens, dtype=np.int64)
+	shifts = np.where(tokens >= TIME_SHIFT, tokens - TIME_SHIFT + 1, 0)
+	times = np.cumsum(shifts)
+	ons = (tokens >= NOTE_ON) & (tokens < NOTE_OFF)
+	offs = (tokens >= NOTE_OFF) & (tokens < TIME_SHIFT)
+	edges = np.zeros((steps + 1, NOTE_RANGE), dtype=np.int64)
+	np.add.at(edges, (times[ons], tokens[ons] - NOTE_ON), 1)
+	np.add.at(edges, (times[offs], tokens[offs] - NOTE_OFF), -1)
+	played = np.cumsum(edges[:steps], axis=0) > 0
+	if not sustain:
+		return played.astype(np.uint8)
+	X = np.zeros((steps, NOTE_RANGE, 3), dtype=np.uint8)
+	X[times[ons], tokens[ons] - NOTE_ON, 1] = 1
+	X[..., 2] = played & (X[..., 1] == 0)
+	return X
+
+def pad_tokens(tokens, offsets, bucket_width=1):
+	# (n, length) int32 batch of the sequences followed by PAD, length being the longest rounded up to bucket_width, and the lengths
+	lengths = np.diff(offsets)
+	length = max(1, -(-int(lengths.max(initial=0)) // bucket_width) * bucket_width)
+	batch = np.full((len(lengths), length), PAD, dtype=np.int32)
+	rows = np.repeat(np.arange(len(lengths)), lengths)
+	cols = np.arange(lengths.sum()) - np.repeat(offsets[:-1] - offsets[0], lengths)
+	batch[rows, cols] = tokens[offsets[0]:offsets[-1]]
+	return batch, lengths.astype(np.int32)
+
+def token_lengths(data, inds, max_shift=MAX_SHIFT, chunk_size=1024):
+	# token count of each of the rolls inds of data, reading chunk_size rolls at a time
+	lengths = np.zeros(len(inds), dtype=np.int64)
+	for start in range(0, len(inds), chunk_size):
+		_, offsets = roll_tokens(read_rows(data, inds[start:start+chunk_size]), max_shift)
+		lengths[start:start+chunk_size] = np.diff(offsets)
+	return lengths
+
+def bucket_batches(data, labels, batch_size, inds, lengths=None, max_shift=MAX_SHIFT, bucket_width=8, \
+		augment=None, epochs=None, rng=np.random):
+	"""
+	Yields (tokens, lengths, batch_y) from the rows inds of data, the cuts of a
+	batch having similar token counts so little of it is padding. Each epoch
+	drops a random len(inds) % batch_size cuts, sorts the rest by length, with
+	ties in random order, and yields their batches in random order. augment, if
+	given, is applied to the rolls before they are tokenized, e.g.
+	note_events.augment_batch, whose key shifts keep every note and so the lengths.
+	"""
+	inds = np.asarray(inds)
+	if lengths is None:
+		lengths = token_lengths(data, inds, max_shift)
+	epoch = 0
+	while epochs is None or epoch < epochs:
+		perm = rng.permutation(len(inds))[:len(inds) - len(inds) % batch_size]
+		perm = perm[np.argsort(lengths[perm], kind='stable')]
+		for batch in rng.permutation(len(perm) // batch_size):
+			batch_inds = inds[perm[batch*batch_size:(batch+1)*batch_size]]
+			batch_x = read_rows(data, batch_inds)
+			if augment is not None:
+				batch_x = augment(batch_x)
+			batch_tokens, batch_lengths = pad_tokens(*roll_tokens(batch_x, max_shift), bucket_width=bucket_width)
+			yield batch_tokens, batch_lengths, labels[batch_inds]
+		epoch += 1
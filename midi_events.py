@@ -0,0 +1,197 @@
+import struct
+import numpy as np
+from note_events import NOTE_EVENT_DTYPE, MIN_PITCH, MAX_PITCH, GRANULARITY, fifths_to_key_name
+from note_events import measure_index, cut_bounds, cut_events
+
+"""
+Standard MIDI file reader that produces the same note-event arrays as
+note_events.parse_xml_events, quantized to a granularity grid (GRANULARITY by
+default), so scraped .mid files can go straight to piano rolls without
+MuseScore or music21.
+"""
+
+def read_varlen(data, pos):
+	value = 0
+	while True:
+		byte = data[pos]
+		pos += 1
+		value = (value << 7) | (byte & 0x7f)
+		if not byte & 0x80:
+			return value, pos
+
+def read_midi(path):
+	"""
+	Returns (ticks_per_quarter, tracks) where each track is a list of
+	(tick, kind, values) with kind one of 'note_on', 'note_off', 'time', 'key'.
+	"""
+	with open(path, 'rb') as f:
+		data = f.read()
+	if data[:4] != b'MThd':
+		raise ValueError("not a MIDI file: " + path)
+	header_len, = struct.unpack('>I', data[4:8])
+	_, num_tracks, division = struct.unpack('>HHH', data[8:14])
+	if division & 0x8000:
+		raise ValueError("SMPTE time division is not supported: " + path)
+	pos = 8 + header_len
+	tracks = []
+	while len(tracks) < num_tracks and pos + 8 <= len(data):
+		chunk_type = data[pos:pos+4]
+		chunk_len, = struct.unpack('>I', data[pos+4:pos+8])
+		pos += 8
+		if chunk_type == b'MTrk':
+			tracks.append(read_track(data, pos, pos + chunk_len))
+		pos += chunk_len
+	return division, tracks
+
+def read_track(data, pos, end):
+	events = []
+	tick = 0
+	status = None
+	while pos < end:
+		delta, pos = read_varlen(data, pos)
+		tick += delta
+		byte = data[pos]
+		if byte & 0x80:
+			pos += 1
+			if byte < 0xf0:
+				status = byte
+		elif status is None:
+			raise ValueError("running status without a status byte")
+		else:
+			byte = status
+		if byte == 0xff:
+			meta_type = data[pos]
+			length, pos = read_varlen(data, pos + 1)
+			payload = data[pos:pos+length]
+			pos += length
+			if meta_type == 0x58 and length >= 2:
+				events.append((tick, 'time', (payload[0], 2**payload[1])))
+			elif meta_type == 0x59 and length >= 1:
+				events.append((tick, 'key', (struct.unpack('b', payload[:1])[0],)))
+			elif meta_type == 0x2f:
+				break
+		elif byte in (0xf0, 0xf7):
+			length, pos = read_varlen(data, pos)
+			pos += length
+		else:
+			kind = byte & 0xf0
+			channel = byte & 0x0f
+			if kind in (0xc0, 0xd0):
+				pos += 1
+			else:
+				pitch, velocity = data[pos], data[pos+1]
+				pos += 2
+				if kind == 0x90 and velocity > 0:
+					events.append((tick, 'note_on', (channel, pitch)))
+				elif kind == 0x80 or kind == 0x90:
+					events.append((tick, 'note_off', (channel, pitch)))
+	return events
+
+def measure_segments(time_changes, step_ticks, end_step, granularity=GRANULARITY):
+	"""
+	Splits the score into constant time signature segments:
+	(start_step, steps_per_measure, first_measure, num_measures, ratioString)
+	"""
+	changes = {}
+	for tick, time_signature in time_changes:
+		changes[int(round(tick / step_ticks))] = time_signature
+	if 0 not in changes:
+		changes[0] = (4, 4)
+	starts = sorted(changes)
+	segments = []
+	measure = 1
+	for i, start_step in enumerate(starts):
+		beats, beat_type = changes[start_step]
+		if i + 1 < len(starts):
+			seg_end = starts[i+1]
+		else:
+			seg_end = max(end_step, start_step + 1)
+		steps_per_measure = granularity * beats / float(beat_type)
+		num_measures = int(np.ceil((seg_end - start_step) / steps_per_measure))
+		segments.append((start_step, steps_per_measure, measure, num_measures, '{}/{}'.format(beats, beat_type)))
+		measure += num_measures
+	return segments
+
+def parse_midi_events(path, granularity=GRANULARITY):
+	"""
+	Returns (events, meta) in the same format as note_events.parse_xml_events.
+	Onsets and durations are snapped to the granularity grid (steps per whole
+	note); every (track, channel) with notes becomes a part.
+	"""
+	ticks_per_quarter, tracks = read_midi(path)
+	step_ticks = ticks_per_quarter * 4.0 / granularity
+	notes = []
+	time_changes = []
+	key_changes = []
+	for track_ind, track in enumerate(tracks):
+		sounding = {}
+		for tick, kind, values in track:
+			if kind == 'note_on':
+				# striking a pitch again ends the note it was sounding, note_off or not
+				if values in sounding:
+					notes.append(((track_ind, values[0]), values[1], sounding[values], tick))
+				sounding[values] = tick
+			elif kind == 'note_off' and values in sounding:
+				notes.append(((track_ind, values[0]), values[1], sounding.pop(values), tick))
+			elif kind == 'time':
+				time_changes.append((tick, values))
+			elif kind == 'key':
+				key_changes.append((tick, values[0]))
+	time_changes.sort(key=lambda change: change[0])
+	key_changes.sort(key=lambda change: change[0])
+
+	parts = sorted(set(note[0] for note in notes))
+	part_ind = dict((part, i) for i, part in enumerate(parts))
+	onsets = np.array([note[2] for note in notes], dtype=np.float64) / step_ticks
+	offsets = np.array([note[3] for note in notes], dtype=np.float64) / step_ticks
+	start_steps = np.rint(onsets).astype(np.int64)
+	num_steps = np.maximum(np.rint(offsets).astype(np.int64) - start_steps, 1)
+	end_step = int((start_steps + num_steps).max()) if len(notes) else 0
+	segments = measure_segments(time_changes, step_ticks, end_step, granularity)
+
+	seg_starts = np.array([seg[0] for seg in segments])
+	seg_ind = np.searchsorted(seg_starts, start_steps, side='right') - 1
+	seg_steps_per_measure = np.array([seg[1] for seg in segments])[seg_ind]
+	measure_in_seg = np.floor((start_steps - seg_starts[seg_ind]) / seg_steps_per_measure).astype(np.int64)
+
+	events = np.zeros(len(notes), dtype=NOTE_EVENT_DTYPE)
+	events['part'] = [part_ind[note[0]] for note in notes]
+	events['pitch'] = [note[1] for note in notes]
+	events['measure'] = np.array([seg[2] for seg in segments])[seg_ind] + measure_in_seg
+	measure_start = seg_starts[seg_ind] + measure_in_seg * seg_steps_per_measure
+	events['offset'] = (start_steps - measure_start) * 4.0 / granularity
+	events['duration'] = num_steps * 4.0 / granularity
+	events = events[np.lexsort((events['offset'], events['measure'], events['part']))]
+
+	meta = {
+		'time_signatures': [],
+		'key_signatures': [],
+		'measures': {},
+		'num_parts': len(parts),
+		'segments': segments
+	}
+	measures = [measure for seg in segments for measure in range(seg[2], seg[2]+seg[3])]
+	for part in range(len(parts)):
+		meta['measures'][part] = measures
+		for seg in segments:
+			meta['time_signatures'].append((part, seg[2], seg[4]))
+		for tick, fifths in key_changes:
+			step = int(round(tick / step_ticks))
+			ind = np.searchsorted(seg_starts, step, side='right') - 1
+			measure = segments[ind][2] + int((step - segments[ind][0]) // segments[ind][1])
+			meta['key_signatures'].append((part, measure, fifths_to_key_name(fifths)))
+	return events, meta
+
+def midi_cuts(events, meta, steps_per_cut):
+	"""
+	Yields (start_measure, num_measures, cut_events) for the same cuts
+	get_cut_score_numsteps takes from a music21 score. Cut measures are
+	renumbered from 1.
+	"""
+	measures = meta['measures'][0] if meta['num_parts'] else []
+	index = measure_index(measures, [(seg[2], seg[4]) for seg in meta['segments']])
+	for start, end, cut in cut_events(events, cut_bounds(index, steps_per_cut)):
+		yield start, end - start + 1, cut
+
+def in_note_range(events):
+	return len(events) == 0 or (events['pitch'].min() >= MIN_PITCH and events['pitch'].max() <= MAX_PITCH)
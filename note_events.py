@@ -0,0 +1,474 @@
+import re
+import xml.etree.ElementTree as ET
+import numpy as np
+
+"""
+Note events extracted straight from MusicXML, without building a music21 Stream.
+Each event is one pitch of one note/chord (or a rest, with pitch -1) and carries
+everything the roll encoders and get_score_stats read off a music21 GeneralNote:
+the part (staff), measure number, offset within the measure and quarterLength,
+and whether it continues the previous event's chord, so notes can be counted
+the way music21 counts GeneralNotes.
+"""
+MAX_PITCH = 108
+MIN_PITCH = 21
+NOTE_RANGE = int(MAX_PITCH - MIN_PITCH + 1)
+GRANULARITY = 16
+REST = -1
+# semitone shift of each key augmentation: cut name suffix k is KEY_SHIFTS[k]
+KEY_SHIFTS = [0, 1, -1, 2, -2, 3, -3, 4, -4, 5, -5]
+PITCH_PAD = max(abs(shift) for shift in KEY_SHIFTS)
+# finest grid rolls are encoded at, 48 ticks per quarter note, and the coarser grids pooled from it
+FINE_GRANULARITY = 192
+PYRAMID_GRANULARITIES = [192, 96, 48, 16, 8]
+
+NOTE_EVENT_DTYPE = np.dtype([
+	('part', np.int16),
+	('measure', np.int32),
+	('offset', np.float64),
+	('duration', np.float64),
+	('pitch', np.int16),
+	('chord', np.bool_)
+])
+
+MEASURE_INDEX_DTYPE = np.dtype([
+	('measure', np.int32),
+	('offset', np.float64),
+	('steps', np.float64),
+	('ratio', 'U8')
+])
+
+STEP_TO_SEMITONE = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+# major key tonics along the circle of fifths, each 7 fifths on adds a sharp
+FIFTHS_LETTERS = 'FCGDAEB'
+
+def fifths_to_key_name(fifths):
+	# same names as KeySignature(fifths).getScale('major').name, also past 7 sharps or flats,
+	# which transposed key augmentations reach
+	accidentals = (fifths + 1) // 7
+	return FIFTHS_LETTERS[(fifths + 1) % 7] + ('#' * accidentals if accidentals > 0 else '-' * -accidentals) + ' major'
+
+def measure_number(number, default):
+	match = re.match(r'\d+', number or '')
+	if match:
+		return int(match.group(0))
+	return default
+
+def local_name(tag):
+	if '}' in tag:
+		return tag[tag.index('}')+1:]
+	return tag
+
+# bump whenever parse_xml_events gives different events for the same file, cached event arrays are keyed on it
+XML_PARSER_VERSION = 2
+
+def iter_xml_events(path):
+	"""
+	Streams a partwise MusicXML file and yields one tuple per event:
+	  ('note', part, measure, offset, quarterLength, midi, chord)   midi is REST for rests and
+	                                                                chord is True after a chord's first note
+	  ('time', part, measure, ratioString)
+	  ('key', part, measure, key_name)
+	  ('measure', part, measure)
+	Parts are numbered per staff, matching music21's PartStaff split of piano parts.
+	"""
+	divisions = 1.0
+	part_ind = 0
+	next_part_ind = 0
+	num_staves = 1
+	measure_ind = 0
+	measure_num = 0
+	cursor = 0.0
+	last_onset = 0.0
+	for event, elem in ET.iterparse(path, events=('start', 'end')):
+		tag = local_name(elem.tag)
+		if event == 'start':
+			if tag == 'score-timewise':
+				raise ValueError("timewise MusicXML is not supported: " + path)
+			if tag == 'part':
+				part_ind = next_part_ind
+				num_staves = 1
+				measure_ind = 0
+			elif tag == 'measure':
+				measure_num = measure_number(elem.get('number'), measure_ind)
+				measure_ind += 1
+				cursor = 0.0
+				last_onset = 0.0
+			continue
+
+		if tag == 'attributes':
+			div = elem.find('divisions')
+			if div is not None:
+				divisions = float(div.text)
+			staves = elem.find('staves')
+			if staves is not None:
+				num_staves = int(staves.text)
+			for time_elem in elem.findall('time'):
+				beats = time_elem.find('beats')
+				beat_type = time_elem.find('beat-type')
+				if beats is not None and beat_type is not None:
+					ratio = beats.text.strip() + '/' + beat_type.text.strip()
+					for staff in staff_numbers(time_elem, num_staves):
+						yield ('time', part_ind + staff - 1, measure_num, ratio)
+			for key_elem in elem.findall('key'):
+				fifths = key_elem.find('fifths')
+				if fifths is not None:
+					name = fifths_to_key_name(int(fifths.text))
+					for staff in staff_numbers(key_elem, num_staves):
+						yield ('key', part_ind + staff - 1, measure_num, name)
+		elif tag == 'backup':
+			cursor -= float(elem.find('duration').text) / divisions
+		elif tag == 'forward':
+			cursor += float(elem.find('duration').text) / divisions
+		elif tag == 'note':
+			if elem.find('cue') is not None:
+				elem.clear()
+				continue
+			staff = elem.find('staff')
+			staff = int(staff.text) if staff is not None else 1
+			is_grace = elem.find('grace') is not None
+			dur = elem.find('duration')
+			quarter_length = 0.0 if is_grace or dur is None else float(dur.text) / divisions
+			is_chord = elem.find('chord') is not None
+			if is_chord:
+				onset = last_onset
+			else:
+				onset = cursor
+				last_onset = onset
+				cursor += quarter_length
+			pitch = elem.find('pitch')
+			if pitch is None:
+				midi = REST
+			else:
+				alter = pitch.find('alter')
+				alter = int(round(float(alter.text))) if alter is not None else 0
+				midi = (int(pitch.find('octave').text) + 1)*12 + STEP_TO_SEMITONE[pitch.find('step').text.strip()] + alter
+			yield ('note', part_ind + staff - 1, measure_num, onset, quarter_length, midi, is_chord)
+			elem.clear()
+		elif tag == 'measure':
+			for staff in range(1, num_staves+1):
+				yield ('measure', part_ind + staff - 1, measure_num)
+			elem.clear()
+		elif tag == 'part':
+			next_part_ind = part_ind + num_staves
+
+def staff_numbers(elem, num_staves):
+	number = elem.get('number')
+	if number is not None:
+		return [int(number)]
+	return range(1, num_staves+1)
+
+def parse_xml_events(path):
+	"""
+	Returns (events, meta) for a MusicXML file, where events is a NOTE_EVENT_DTYPE
+	array in document order and meta holds the time/key signatures and measures.
+	"""
+	notes = []
+	meta = {
+		'time_signatures': [],
+		'key_signatures': [],
+		'measures': {}
+	}
+	for event in iter_xml_events(path):
+		kind = event[0]
+		if kind == 'note':
+			notes.append(event[1:])
+		elif kind == 'time':
+			meta['time_signatures'].append(event[1:])
+		elif kind == 'key':
+			meta['key_signatures'].append(event[1:])
+		else:
+			meta['measures'].setdefault(event[1], []).append(event[2])
+	meta['num_parts'] = len(meta['measures'])
+	return np.array(notes, dtype=NOTE_EVENT_DTYPE), meta
+
+def event_stats(events, meta, granularity=GRANULARITY):
+	"""
+	The note stats create_dataset's get_score_stats used to gather in a music21
+	walk (pitch range, finest note value, indivisible notes, time and key
+	signatures), from parse_xml_events output. As in the walk, rests and grace
+	notes count as notes and a chord counts once, by its first note.
+	"""
+	pitches = events['pitch'][events['pitch'] != REST]
+	notes = events[~events['chord']]
+	durations = notes['duration'][notes['duration'] != 0]
+	indivisible_notes = int(np.count_nonzero(~on_grid(durations, granularity)))
+	return {
+		'min_note': int(pitches.min()) if len(pitches) else None,
+		'max_note': int(pitches.max()) if len(pitches) else None,
+		# notes per whole note of the shortest note, 4.0 / quarterLength
+		'granularity': float(np.round(4.0 / durations.min(), 6)) if len(durations) else None,
+		'divisible_notes': indivisible_notes == 0,
+		'1%+_divisible': indivisible_notes / len(notes) < 0.01,
+		'%_indivisible': indivisible_notes / len(notes),
+		'time_signatures': frozenset(ratio for _, _, ratio in meta['time_signatures']),
+		'key_signatures': frozenset(key_name for _, _, key_name in meta['key_signatures'])
+	}
+
+def encode_events(events, num_measures, steps_per_cut, image=False, granularity=GRANULARITY):
+	# (steps_per_cut, NOTE_RANGE) piano roll, or (steps_per_cut, NOTE_RANGE, 1) with image
+	if image:
+		X_score = np.zeros((steps_per_cut, NOTE_RANGE, 1))
+	else:
+		X_score = np.zeros((steps_per_cut, NOTE_RANGE))
+	steps_per_measure = steps_per_cut / num_measures
+	fill_notes(X_score.reshape(steps_per_cut, -1), *event_steps(events, num_measures, steps_per_measure, granularity))
+	return X_score
+
+def encode_events_sustain(events, num_measures, steps_per_cut, granularity=GRANULARITY):
+	# (steps_per_cut, NOTE_RANGE, 3) roll with channels [unused, onset, sustain]
+	X_score = np.zeros((steps_per_cut, NOTE_RANGE, 3))
+	steps_per_measure = steps_per_cut / num_measures
+	fill_notes_sustain(X_score, *event_steps(events, num_measures, steps_per_measure, granularity))
+	return X_score
+
+def on_grid(quarter_lengths, granularity):
+	# quarter_lengths that are whole steps of the granularity grid, with some slack for durations like 1/3 at fine grids
+	steps = quarter_lengths * granularity / 4.0
+	return np.abs(steps - np.rint(steps)) < 1e-6
+
+def event_steps(events, num_measures, steps_per_measure, granularity=GRANULARITY):
+	# (start_steps, num_steps, pitch_indices) arrays of every encodable note
+	notes = encodable_notes(events, granularity)
+	measure_starts = ((notes['measure'] - 1) % num_measures) * steps_per_measure
+	return note_steps(notes, measure_starts, granularity)
+
+def encodable_notes(events, granularity=GRANULARITY):
+	# notes in MIN_PITCH..MAX_PITCH that last a whole number of granularity steps
+	return events[(events['pitch'] >= MIN_PITCH) & (events['pitch'] <= MAX_PITCH) & on_grid(events['duration'], granularity)]
+
+def note_steps(notes, measure_starts, granularity=GRANULARITY):
+	# (start_steps, num_steps, pitch_indices) of notes whose measures start at measure_starts steps
+	starts = measure_starts + notes['offset'] * granularity / 4.0
+	# the slack keeps a triplet at 15.999... fine steps on step 16
+	return (starts + 1e-6).astype(np.int64), np.rint(notes['duration'] * granularity / 4.0).astype(np.int64), (notes['pitch'] - MIN_PITCH).astype(np.int64)
+
+def fill_notes(X, starts, lengths, pitches):
+	"""
+	X[start:start+length, pitch] = 1 for every note at once. Each note adds 1 at
+	its start step and takes it away at its end, so a cumsum down the time axis
+	is positive exactly where some note is sounding. X is (steps, pitches).
+	"""
+	starts = np.asarray(starts, dtype=np.int64)
+	pitches = np.asarray(pitches, dtype=np.int64)
+	num_steps, num_pitches = X.shape[:2]
+	# slicing semantics: notes are cut off at the end of X, and ones starting past it are dropped
+	ends = np.minimum(starts + np.asarray(lengths, dtype=np.int64), num_steps)
+	keep = (starts >= 0) & (starts < ends) & (pitches >= 0) & (pitches < num_pitches)
+	if not keep.any():
+		return X
+	size = (num_steps + 1) * num_pitches
+	edges = np.bincount(starts[keep]*num_pitches + pitches[keep], minlength=size) - np.bincount(ends[keep]*num_pitches + pitches[keep], minlength=size)
+	X[np.cumsum(edges.reshape(num_steps + 1, num_pitches)[:-1], axis=0) > 0] = 1
+	return X
+
+def fill_notes_sustain(X, starts, lengths, pitches):
+	# onset in channel 1 at each note's first step, sustain in channel 2 for the rest of it
+	starts = np.asarray(starts, dtype=np.int64)
+	pitches = np.asarray(pitches, dtype=np.int64)
+	onsets = (starts >= 0) & (starts < X.shape[0]) & (pitches >= 0) & (pitches < X.shape[1])
+	X[starts[onsets], pitches[onsets], 1] = 1
+	fill_notes(X[..., 2], starts + 1, np.asarray(lengths, dtype=np.int64) - 1, pitches)
+	return X
+
+def split_aug_name(aug_name):
+	# (cut_name, k) of a key augmented cut name, score_name-j-k
+	cut_name, k = aug_name.rsplit('-', 1)
+	return cut_name, int(k)
+
+def steps_per_measure(ratio, granularity=GRANULARITY):
+	# same as GRANULARITY*ts.beatCount*ts.beatDuration.quarterLength/4.0 for TimeSignature(ratio)
+	beats, beat_type = ratio.split('/')
+	return granularity * float(beats) / float(beat_type)
+
+def measure_index(measures, time_signatures):
+	"""
+	One pass over a part's measure numbers, in score order, and its
+	(measure, ratioString) time signature changes. Returns a MEASURE_INDEX_DTYPE
+	array with the time signature in effect, steps and nominal offset (in
+	quarters) of every measure.
+	"""
+	changes = dict(time_signatures)
+	index = np.zeros(len(measures), dtype=MEASURE_INDEX_DTYPE)
+	ratio = changes.get(measures[0], '4/4') if len(measures) else '4/4'
+	offset = 0.0
+	for i, measure in enumerate(measures):
+		ratio = changes.get(measure, ratio)
+		steps = steps_per_measure(ratio)
+		index[i] = (measure, offset, steps, ratio)
+		offset += steps * 4.0 / GRANULARITY
+	return index
+
+def cut_bounds(index, steps_per_cut):
+	"""
+	Yields (start_measure, end_measure, ratioString) for every cut
+	get_cut_score_numsteps takes: the score is split where the time signature
+	changes, and each stretch is cut into int(steps_per_cut/steps_per_measure)
+	measure blocks while whole blocks are left.
+	"""
+	index = index[index['measure'] >= 1]
+	measures = index['measure']
+	seg_start = 0
+	for i in range(1, len(index) + 1):
+		last = i == len(index)
+		if not last and index['ratio'][i] == index['ratio'][seg_start]:
+			continue
+		# like get_cut_score_numsteps, the final measure never makes it into a cut
+		first_measure = measures[seg_start]
+		last_measure = measures[i-1] - 1 if last else measures[i] - 1
+		measures_per_cut = int(steps_per_cut / index['steps'][seg_start])
+		start = first_measure
+		while measures_per_cut >= 1:
+			end = start + measures_per_cut - 1
+			present = np.searchsorted(measures, min(end, last_measure), side='right') - np.searchsorted(measures, start, side='left')
+			if present != measures_per_cut:
+				break
+			yield int(start), int(end), index['ratio'][seg_start]
+			start += measures_per_cut
+		seg_start = i
+
+def cut_events(events, bounds):
+	"""
+	Yields (start_measure, end_measure, cut_events) for each of bounds, with the
+	cut's measures renumbered from 1. The events are sorted by measure once and
+	every cut is a slice of them.
+	"""
+	events = events[np.argsort(events['measure'], kind='stable')]
+	for bound in bounds:
+		start, end = bound[0], bound[1]
+		lo = np.searchsorted(events['measure'], start, side='left')
+		hi = np.searchsorted(events['measure'], end, side='right')
+		cut = events[lo:hi].copy()
+		cut['measure'] -= start - 1
+		yield start, end, cut
+
+def part_measure_index(meta, part=0):
+	# measure_index of one part of parse_xml_events/parse_midi_events meta
+	time_signatures = [(measure, ratio) for ts_part, measure, ratio in meta['time_signatures'] if ts_part == part]
+	return measure_index(meta['measures'].get(part, []), time_signatures)
+
+def roll_steps(events, index):
+	"""
+	(start_steps, num_steps, pitch_indices) arrays of every encodable note on the
+	score's continuous time axis, where each measure starts after the steps of
+	all the measures before it in index.
+	"""
+	notes = encodable_notes(events)
+	if not len(index):
+		notes = notes[:0]
+		note_starts = np.zeros(0, dtype=np.int64)
+	else:
+		measure_starts = np.rint(index['offset'] * GRANULARITY / 4.0).astype(np.int64)
+		order = np.argsort(index['measure'], kind='stable')
+		rows = np.minimum(np.searchsorted(index['measure'][order], notes['measure']), len(order) - 1)
+		# notes in measures the index doesn't have are left out
+		found = index['measure'][order[rows]] == notes['measure']
+		notes = notes[found]
+		note_starts = measure_starts[order[rows[found]]]
+	# quantized like event_steps, so a roll and the cuts taken from the same score agree
+	return note_steps(notes, note_starts)
+
+def roll_length(index):
+	if not len(index):
+		return 0
+	return int(np.rint((index['offset'][-1] * GRANULARITY / 4.0) + index['steps'][-1]))
+
+def encode_roll(events, index):
+	# the whole score as one (steps, NOTE_RANGE) piano roll, cut into windows with roll_windows
+	X_roll = np.zeros((roll_length(index), NOTE_RANGE), dtype=np.uint8)
+	return fill_notes(X_roll, *roll_steps(events, index))
+
+def encode_roll_sustain(events, index):
+	# encode_roll with encode_events_sustain's [unused, onset, sustain] channels
+	X_roll = np.zeros((roll_length(index), NOTE_RANGE, 3), dtype=np.uint8)
+	return fill_notes_sustain(X_roll, *roll_steps(events, index))
+
+def pool_steps(X, factor):
+	"""
+	X pooled over every factor steps of its time axis, which must be a multiple
+	of factor. Binary rolls are max pooled, an OR. An [unused, onset, sustain]
+	roll gets an onset at a pooled step if any of its steps has one, and sustain
+	only if its first step has it, i.e. a note carried over from an earlier
+	pooled step, the way encoding at the coarse grid would mark it.
+	"""
+	if len(X) % factor:
+		raise ValueError("{} steps can't be pooled by {}".format(len(X), factor))
+	windows = X.reshape((len(X) // factor, factor) + X.shape[1:])
+	pooled = windows.max(axis=1)
+	if X.ndim == 3 and X.shape[2] == 3:
+		pooled[..., 2] = windows[:, 0, :, 2]
+	return pooled
+
+def roll_pyramid(X_fine, fine_granularity=FINE_GRANULARITY, granularities=PYRAMID_GRANULARITIES):
+	"""
+	{granularity: roll} of X_fine, encoded at fine_granularity, at each of
+	granularities. Every level is pooled from the coarsest level already made
+	that it divides, rather than from X_fine each time.
+	"""
+	levels = {fine_granularity: X_fine}
+	for granularity in sorted(granularities, reverse=True):
+		if fine_granularity % granularity:
+			raise ValueError("granularity {} doesn't divide {}".format(granularity, fine_granularity))
+		source = min(g for g in levels if g % granularity == 0)
+		levels[granularity] = pool_steps(levels[source], source // granularity)
+	return dict((granularity, levels[granularity]) for granularity in granularities)
+
+def roll_windows(roll, steps_per_window, stride):
+	"""
+	Every steps_per_window long window of roll starting at a multiple of stride,
+	as a read only (num_windows, steps_per_window, ...) view: no window is copied.
+	"""
+	num_windows = max((len(roll) - steps_per_window) // stride + 1, 0)
+	return np.lib.stride_tricks.as_strided(roll, shape=(num_windows, steps_per_window) + roll.shape[1:], \
+			strides=(roll.strides[0]*stride,) + roll.strides, writeable=False)
+
+def window_starts(roll_offsets, steps_per_window, stride):
+	"""
+	(roll_ind, start_step) of every window over rolls concatenated along the
+	time axis, with roll i at roll_offsets[i]:roll_offsets[i+1]. Windows never
+	cross from one roll into the next.
+	"""
+	roll_inds = []
+	starts = []
+	for i in range(len(roll_offsets) - 1):
+		num_windows = max((roll_offsets[i+1] - roll_offsets[i] - steps_per_window) // stride + 1, 0)
+		roll_inds.append(np.full(num_windows, i, dtype=np.int64))
+		starts.append(roll_offsets[i] + stride*np.arange(num_windows, dtype=np.int64))
+	if not roll_inds:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+	return np.concatenate(roll_inds), np.concatenate(starts)
+
+def base_cuts(aug_names):
+	# the untransposed (k = 0) cuts among key augmented cut names
+	return [name for name in aug_names if split_aug_name(name)[1] == 0]
+
+def shift_axis(batch, shifts, axis):
+	# batch[i] moved shifts[i] places along axis, zero filled rather than wrapped
+	size = batch.shape[axis]
+	src = np.arange(size)[None, :] - np.asarray(shifts)[:, None]
+	shape = [len(batch)] + [1]*(batch.ndim - 1)
+	shape[axis] = size
+	valid = ((src >= 0) & (src < size)).reshape(shape)
+	src = np.clip(src, 0, size - 1).reshape(shape)
+	return np.take_along_axis(batch, src, axis=axis) * valid
+
+def augment_batch(batch, max_shift=PITCH_PAD, max_time_shift=0, rng=np.random):
+	"""
+	Random key shift, and optionally time shift, of every roll in a
+	(batch, steps, NOTE_RANGE, ...) batch, for augmenting in the training input
+	pipeline instead of storing transposed copies. Each example's pitch shift is
+	drawn from the shifts in -max_shift..max_shift that keep all its notes inside
+	MIN_PITCH..MAX_PITCH.
+	"""
+	n, steps, num_pitches = batch.shape[:3]
+	played = batch.reshape(n, steps, num_pitches, -1).any(axis=(1, 3))
+	silent = ~played.any(axis=1)
+	lowest = np.where(silent, 0, played.argmax(axis=1))
+	highest = np.where(silent, num_pitches - 1, num_pitches - 1 - played[:, ::-1].argmax(axis=1))
+	lo = np.maximum(-max_shift, -lowest)
+	hi = np.minimum(max_shift, num_pitches - 1 - highest)
+	shifts = lo + (rng.random_sample(n) * (hi - lo + 1)).astype(np.int64)
+	batch = shift_axis(batch, shifts, 2)
+	if max_time_shift:
+		batch = shift_axis(batch, rng.randint(-max_time_shift, max_time_shift + 1, n), 1)
+	return batch
@@ -0,0 +1,90 @@
+import numpy as np
+
+"""
+Bit packed piano rolls, for keeping a whole encoded dataset in memory.
+Binary rolls, (steps, pitches) or (steps, pitches, 1), take 1 bit per cell in
+np.packbits order. 3 channel onset/sustain rolls, [unused, onset, sustain],
+take 2 bits per cell: the high bit is sustain and the low bit is onset, so a
+cell that is both still round trips. Indexing a PackedRolls unpacks just those
+rolls, straight to float32 through a per byte lookup table.
+"""
+
+def cell_bits(roll_shape):
+	# bits per cell of a roll of roll_shape
+	if len(roll_shape) == 3 and roll_shape[2] == 3:
+		return 2
+	return 1
+
+def unpack_table(bits, dtype=np.float32):
+	# table[byte] is the 8 // bits cells the byte holds, with the onset/sustain channels for 2 bit cells
+	cells = 8 // bits
+	shifts = 8 - bits*(np.arange(cells) + 1)
+	codes = (np.arange(256)[:, None] >> shifts) & ((1 << bits) - 1)
+	if bits == 1:
+		return codes.astype(dtype)
+	table = np.zeros((256, cells, 3), dtype=dtype)
+	table[:, :, 1] = codes & 1
+	table[:, :, 2] = codes >> 1
+	return table
+
+def pack_rolls(X):
+	# (n,) + roll_shape rolls to a (n, bytes_per_roll) uint8 array
+	X = np.asarray(X)
+	n = len(X)
+	if cell_bits(X.shape[1:]) == 1:
+		return np.packbits(X.reshape(n, -1) != 0, axis=1)
+	codes = (X[..., 1] != 0).astype(np.uint8) | ((X[..., 2] != 0).astype(np.uint8) << 1)
+	codes = codes.reshape(n, -1)
+	pad = -codes.shape[1] % 4
+	if pad:
+		codes = np.concatenate([codes, np.zeros((n, pad), dtype=np.uint8)], axis=1)
+	codes = codes.reshape(n, -1, 4)
+	return (codes[:, :, 0] << 6) | (codes[:, :, 1] << 4) | (codes[:, :, 2] << 2) | codes[:, :, 3]
+
+def unpack_rolls(packed, roll_shape, dtype=np.float32, table=None):
+	# inverse of pack_rolls, returns (n,) + roll_shape rolls of dtype
+	if table is None:
+		table = unpack_table(cell_bits(roll_shape), dtype)
+	n = len(packed)
+	cells = table[packed].reshape((n, -1) + table.shape[2:])
+	return cells[:, :roll_shape[0]*roll_shape[1]].reshape((n,) + tuple(roll_shape))
+
+class PackedRolls(object):
+	"""
+	(n,) + roll_shape rolls held packed. rolls[i] and rolls[inds] unpack to
+	float32 like indexing the dense array would, rows() selects rolls without
+	unpacking them.
+	"""
+	def __init__(self, packed, roll_shape, dtype=np.float32):
+		self.packed = packed
+		self.roll_shape = tuple(int(size) for size in roll_shape)
+		self.dtype = dtype
+		self.table = unpack_table(cell_bits(self.roll_shape), dtype)
+
+	@classmethod
+	def pack(cls, X, dtype=np.float32):
+		return cls(pack_rolls(X), np.shape(X)[1:], dtype)
+
+	@classmethod
+	def load(cls, name, mmap_mode=None, dtype=np.float32):
+		# name.npy holds the packed rolls and name_shape.npy the shape of one roll
+		return cls(np.load(name + '.npy', mmap_mode=mmap_mode), np.load(name + '_shape.npy'), dtype)
+
+	def save(self, name):
+		np.save(name, self.packed)
+		np.save(name + '_shape', np.array(self.roll_shape, dtype=np.int64))
+
+	@property
+	def shape(self):
+		return (len(self),) + self.roll_shape
+
+	def __len__(self):
+		return len(self.packed)
+
+	def rows(self, inds):
+		return PackedRolls(self.packed[inds], self.roll_shape, self.dtype)
+
+	def __getitem__(self, inds):
+		if isinstance(inds, (int, np.integer)):
+			return self[[inds]][0]
+		return unpack_rolls(self.packed[inds], self.roll_shape, table=self.table)
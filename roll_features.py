@@ -0,0 +1,66 @@
+import numpy as np
+from note_events import NOTE_RANGE, MIN_PITCH
+
+"""
+Narrow per step features of piano roll batches, for models that do not need
+all NOTE_RANGE pitch columns, most of which are empty in any one cut. Chroma is
+the 12 pitch classes sounding at each step, C first. Polyphony is the pitch
+indices of the lowest k notes sounding at each step as int8, -1 filling the
+slots past the last note; it is lossless for rolls that never have more than k
+notes at once (see max_polyphony) and polyphony_roll inverts it. Both take
+binary (n, steps, pitches) rolls or (n, steps, pitches, channels) rolls, where
+a pitch sounds if any of its channels is set.
+"""
+CHROMA = 12
+POLYPHONY = 10
+# input width of each kind of frame_features
+FEATURE_WIDTHS = {'roll': NOTE_RANGE, 'chroma': CHROMA, 'polyphony': POLYPHONY}
+
+def played_pitches(X):
+	X = np.asarray(X)
+	return X.reshape(X.shape[:3] + (-1,)).any(axis=3)
+
+def roll_chroma(X, dtype=np.float32):
+	played = played_pitches(X)
+	n, steps, num_pitches = played.shape
+	# put pitch index 0, MIN_PITCH, at its pitch class and fold the octaves on top of each other
+	offset = MIN_PITCH % CHROMA
+	octaves = -(-(offset + num_pitches) // CHROMA)
+	wide = np.zeros((n, steps, octaves*CHROMA), dtype=bool)
+	wide[:, :, offset:offset+num_pitches] = played
+	return wide.reshape(n, steps, octaves, CHROMA).any(axis=2).astype(dtype)
+
+def max_polyphony(X):
+	# most notes sounding at one step of any roll of X
+	return int(played_pitches(X).sum(axis=2).max(initial=0))
+
+def roll_polyphony(X, k=POLYPHONY):
+	played = played_pitches(X)
+	# the rank of each sounding pitch among those of its step, low to high
+	ranks = np.cumsum(played, axis=2) - 1
+	rolls, steps, pitches = np.nonzero(played & (ranks < k))
+	P = np.full(played.shape[:2] + (k,), -1, dtype=np.int8)
+	P[rolls, steps, ranks[rolls, steps, pitches]] = pitches
+	return P
+
+def polyphony_roll(P, num_pitches=NOTE_RANGE, dtype=np.float32):
+	# inverse of roll_polyphony, (n, steps, num_pitches) binary rolls
+	P = np.asarray(P, dtype=np.int64)
+	X = np.zeros(P.shape[:2] + (num_pitches + 1,), dtype=dtype)
+	# empty slots, -1, all land in the extra last column
+	np.put_along_axis(X, P % (num_pitches + 1), 1, axis=2)
+	return X[:, :, :num_pitches]
+
+def polyphony_features(P, num_pitches=NOTE_RANGE):
+	# float32 pitch height of every polyphony slot in (0, 1], 0 for an empty slot
+	return (np.asarray(P, dtype=np.float32) + 1) / num_pitches
+
+def frame_features(X, features):
+	# a batch of rolls as (n, steps, FEATURE_WIDTHS[features]) float32 model input
+	if features == 'roll':
+		return np.asarray(X, dtype=np.float32).reshape(np.shape(X)[:2] + (-1,))
+	if features == 'chroma':
+		return roll_chroma(X)
+	if features == 'polyphony':
+		return polyphony_features(roll_polyphony(X))
+	raise ValueError("unknown frame features " + features)
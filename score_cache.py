@@ -0,0 +1,141 @@
+import os
+import io
+import hashlib
+import numpy as np
+import music21
+from music21.freezeThaw import StreamFreezer
+from music21.freezeThaw import StreamThawer
+
+"""
+On-disk cache of parsed music21 scores.
+Entries are keyed by the sha1 of the source file contents plus the music21
+version, so renaming or touching a file keeps its entry and upgrading music21
+invalidates everything. The least recently used entries are evicted once the
+cache grows past max_bytes. Several worker processes share one cache directory,
+so rather than trusting its own count each process measures the directory
+again after every check_fraction of max_bytes it writes; the cache overshoots
+by at most that much per process.
+"""
+CACHE_DIR = os.path.expanduser('~/.apollo/score_cache/')
+CACHE_MAX_BYTES = 8*1024**3
+ENCODING_CACHE_DIR = os.path.expanduser('~/.apollo/encoding_cache/')
+ENCODING_CACHE_MAX_BYTES = 2*1024**3
+
+def file_hash(path):
+	h = hashlib.sha1()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+class DiskCache(object):
+	def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, check_fraction=0.01):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		self.check_bytes = max(1, int(max_bytes * check_fraction))
+		# bytes this process has written since it last measured the directory
+		self.unchecked_bytes = 0
+
+	def path(self, key):
+		return os.path.join(self.cache_dir, key[:2], key)
+
+	def get(self, key):
+		path = self.path(key)
+		try:
+			with open(path, 'rb') as f:
+				data = f.read()
+		except (IOError, OSError):
+			return None
+		# bump mtime so eviction is least recently used rather than oldest written
+		try:
+			os.utime(path, None)
+		except OSError:
+			pass
+		return data
+
+	def put(self, key, data):
+		path = self.path(key)
+		if not os.path.exists(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+		tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+		with open(tmp_path, 'wb') as f:
+			f.write(data)
+		os.replace(tmp_path, path)
+		self.unchecked_bytes += len(data)
+		if self.unchecked_bytes >= self.check_bytes:
+			self.unchecked_bytes = 0
+			if self.size() > self.max_bytes:
+				self.evict()
+
+	def entries(self):
+		entries = []
+		if not os.path.exists(self.cache_dir):
+			return entries
+		for root, _, names in os.walk(self.cache_dir):
+			for name in names:
+				if name.endswith('.tmp'):
+					continue
+				try:
+					st = os.stat(os.path.join(root, name))
+				except OSError:
+					continue
+				entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+		return entries
+
+	def size(self):
+		return sum(size for _, size, _ in self.entries())
+
+	def evict(self):
+		entries = sorted(self.entries())
+		total = sum(size for _, size, _ in entries)
+		# evict down to 90% so a full cache doesn't evict again on every check
+		target = int(self.max_bytes * 0.9)
+		for _, size, path in entries:
+			if total <= target:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				# another worker got to it first
+				pass
+			total -= size
+
+score_cache = DiskCache()
+
+def score_key(path):
+	return file_hash(path) + '-' + music21.__version__
+
+def parse_score(path, cache=score_cache):
+	key = score_key(path)
+	data = cache.get(key)
+	if data is not None:
+		thawer = StreamThawer()
+		thawer.openStr(data)
+		return thawer.stream
+	score = music21.converter.parse(path, forceSource=True)
+	cache.put(key, StreamFreezer(score).writeStr(fmt='pickle'))
+	return score
+
+encoding_cache = DiskCache(ENCODING_CACHE_DIR, ENCODING_CACHE_MAX_BYTES)
+
+def cached_encoding(path, variant, encode, cache=encoding_cache):
+	"""
+	encode(path), an array, cached under the sha1 of the file and variant, which
+	should name everything else the encoding depends on (encoder, GRANULARITY,
+	steps per cut, ...).
+	"""
+	key = file_hash(path) + '-' + variant
+	data = cache.get(key)
+	if data is not None:
+		return np.load(io.BytesIO(data))
+	X = encode(path)
+	store_encoding(path, variant, X, cache, key)
+	return X
+
+def store_encoding(path, variant, X, cache=encoding_cache, key=None):
+	# puts X in the cache as cached_encoding(path, variant, ...) would, for an X computed along with something else
+	if key is None:
+		key = file_hash(path) + '-' + variant
+	buf = io.BytesIO()
+	np.save(buf, X)
+	cache.put(key, buf.getvalue())
@@ -0,0 +1,95 @@
+import numpy as np
+
+"""
+Piano rolls as their nonzero cells only. Every cell that is set is a
+(step, pitch, channel) triple, the triples of all rolls are kept end to end
+and offsets[i]:offsets[i+1] are roll i's, so storing, selecting and shuffling
+rolls costs in proportion to the notes rather than steps*pitches. Indexing a
+SparseRolls densifies just those rolls, to float32, as they are fed.
+"""
+
+def roll_cells(X):
+	# (steps, pitches, channels) of the nonzero cells of one roll; channels are 0 for 2D rolls
+	X = np.asarray(X)
+	nonzero = np.nonzero(X)
+	channels = nonzero[2] if X.ndim == 3 else np.zeros(len(nonzero[0]), dtype=np.int64)
+	return nonzero[0].astype(np.uint16), nonzero[1].astype(np.uint8), channels.astype(np.uint8)
+
+def gather_ranges(offsets, inds):
+	# (row, position) of every cell of rolls inds, row being its place in inds
+	inds = np.asarray(inds, dtype=np.int64)
+	starts = offsets[inds]
+	counts = offsets[inds + 1] - starts
+	rows = np.repeat(np.arange(len(inds)), counts)
+	# position runs starts[row], starts[row]+1, ... within each roll
+	positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - starts, counts)
+	return rows, positions, counts
+
+class SparseRolls(object):
+	def __init__(self, steps, pitches, channels, offsets, roll_shape, dtype=np.float32):
+		self.steps = steps
+		self.pitches = pitches
+		self.channels = channels
+		self.offsets = offsets
+		self.roll_shape = tuple(int(size) for size in roll_shape)
+		self.dtype = dtype
+
+	@classmethod
+	def from_cells(cls, cells, roll_shape, dtype=np.float32):
+		# cells is a list of roll_cells() triples, one per roll
+		offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum([len(steps) for steps, _, _ in cells])
+		def column(i, col_dtype):
+			if not cells:
+				return np.zeros(0, dtype=col_dtype)
+			return np.concatenate([cell[i] for cell in cells]).astype(col_dtype)
+		return cls(column(0, np.uint16), column(1, np.uint8), column(2, np.uint8), offsets, roll_shape, dtype)
+
+	@classmethod
+	def from_dense(cls, X, dtype=np.float32):
+		return cls.from_cells([roll_cells(roll) for roll in X], np.shape(X)[1:], dtype)
+
+	@classmethod
+	def load(cls, name, mmap_mode=None, dtype=np.float32):
+		# one .npy per array, so the cells can be memory mapped
+		arrays = [np.load('{}_{}.npy'.format(name, key), mmap_mode=mmap_mode) for key in ('steps', 'pitches', 'channels', 'offsets')]
+		return cls(*arrays, roll_shape=np.load(name + '_shape.npy'), dtype=dtype)
+
+	def save(self, name):
+		for key in ('steps', 'pitches', 'channels', 'offsets'):
+			np.save('{}_{}'.format(name, key), getattr(self, key))
+		np.save(name + '_shape', np.array(self.roll_shape, dtype=np.int64))
+
+	@property
+	def shape(self):
+		return (len(self),) + self.roll_shape
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def num_cells(self, i):
+		return int(self.offsets[i+1] - self.offsets[i])
+
+	def indices(self, inds):
+		# inds as an array of roll numbers, for any index numpy would take
+		return np.arange(len(self))[inds]
+
+	def rows(self, inds):
+		# the rolls inds, still sparse
+		_, positions, counts = gather_ranges(self.offsets, self.indices(inds))
+		offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum(counts)
+		return SparseRolls(self.steps[positions], self.pitches[positions], self.channels[positions], \
+				offsets, self.roll_shape, self.dtype)
+
+	def __getitem__(self, inds):
+		if isinstance(inds, (int, np.integer)):
+			return self[[inds]][0]
+		inds = self.indices(inds)
+		rows, positions, _ = gather_ranges(self.offsets, inds)
+		X = np.zeros((len(inds),) + self.roll_shape, dtype=self.dtype)
+		if len(self.roll_shape) == 3:
+			X[rows, self.steps[positions], self.pitches[positions], self.channels[positions]] = 1
+		else:
+			X[rows, self.steps[positions], self.pitches[positions]] = 1
+		return X
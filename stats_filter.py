@@ -0,0 +1,123 @@
+import numpy as np
+
+"""
+Vectorized version of the per-score pruning checks in valid_score/prune_dataset.
+score_to_stats is loaded once into column arrays, with the time and key
+signature sets stored as bitmasks over their vocabularies, and every filter
+is evaluated as one boolean mask over all scores.
+"""
+GRANULARITY = 16
+
+FILTER_REASONS = {
+	'parts': 'discarded_num_parts',
+	'time_signatures': 'discarded_time_signature',
+	'key_signatures': 'discarded_key_signature',
+	'pickups': 'discarded_has_pickup',
+	'num_measures': 'discarded_num_measures',
+	'note_range': 'discarded_note_range',
+	'consistent_measures': 'discarded_consistent_measures',
+	'granularity': 'discarded_granularity',
+	'percent_indivisible': 'discarded_%_divisible',
+	'consistent_time': 'discarded_consistent_time',
+	'consistent_key': 'discarded_consistent_key',
+	'consistent_parts': 'discarded_consistent_parts',
+	'num_steps': 'discarded_num_steps'
+}
+
+def steps_per_measure(ratio, granularity=GRANULARITY):
+	# same as GRANULARITY*ts.beatCount*ts.beatDuration.quarterLength/4.0 for TimeSignature(ratio)
+	beats, beat_type = ratio.split('/')
+	return granularity * float(beats) / float(beat_type)
+
+def bitmask(values, vocab):
+	mask = 0
+	for val in values:
+		if val in vocab:
+			mask |= 1 << vocab[val]
+	return mask
+
+class StatsTable(object):
+	def __init__(self, score_to_stats, score_names=None, indivisible_stat='1%+_divisible'):
+		if score_names is None:
+			score_names = list(score_to_stats)
+		self.names = np.array(score_names, dtype=object)
+		stats = [score_to_stats[score_name] for score_name in score_names]
+
+		self.num_parts = np.array([s['num_parts'] for s in stats], dtype=np.int64)
+		self.has_pickup = np.array([s['has_pickup'] for s in stats], dtype=bool)
+		self.num_measures = np.array([s['num_measures'] for s in stats], dtype=np.int64)
+		self.min_note = np.array([np.nan if s['min_note'] is None else s['min_note'] for s in stats], dtype=np.float64)
+		self.max_note = np.array([np.nan if s['max_note'] is None else s['max_note'] for s in stats], dtype=np.float64)
+		self.granularity = np.array([np.nan if s['granularity'] is None else s['granularity'] for s in stats], dtype=np.float64)
+		self.indivisible = np.array([s[indivisible_stat] for s in stats], dtype=bool)
+		self.consistent_measures = np.array([s['consistent_measures'] for s in stats], dtype=bool)
+		self.consistent_time = np.array([s['consistent_time'] for s in stats], dtype=bool)
+		self.consistent_key = np.array([s['consistent_key'] for s in stats], dtype=bool)
+		self.consistent_parts = np.array([s['consistent_parts'] for s in stats], dtype=bool)
+
+		self.time_vocab = self.vocab(s['time_signatures'] for s in stats)
+		self.key_vocab = self.vocab(s['key_signatures'] for s in stats)
+		self.time_signatures = np.array([bitmask(s['time_signatures'], self.time_vocab) for s in stats], dtype=np.uint64)
+		self.key_signatures = np.array([bitmask(s['key_signatures'], self.key_vocab) for s in stats], dtype=np.uint64)
+
+		# steps per measure of the only time signature, nan when there isn't exactly one
+		ts_steps = dict((ts, steps_per_measure(ts)) for ts in self.time_vocab)
+		self.single_ts_steps = np.array([ts_steps[next(iter(s['time_signatures']))] if len(s['time_signatures']) == 1 else np.nan for s in stats], dtype=np.float64)
+
+	def __len__(self):
+		return len(self.names)
+
+	def vocab(self, value_sets):
+		vocab = {}
+		for values in value_sets:
+			for val in values:
+				if val not in vocab:
+					vocab[val] = len(vocab)
+		if len(vocab) > 64:
+			raise ValueError("too many distinct signatures for a 64 bit mask: {}".format(len(vocab)))
+		return vocab
+
+	def not_subset(self, column, vocab, allowed):
+		outside = ~np.uint64(bitmask(allowed, vocab))
+		return (column & outside) != 0
+
+	def discard_masks(self, time_signatures=set(), pickups=False, parts=set(), note_range=[], num_measures=0, \
+			key_signatures=set(), granularity=0, consistent_measures=False, consistent_time=False, consistent_key=False, \
+			consistent_parts=False, percent_indivisible=0.0, has_key_signature=False, num_steps=0):
+		masks = {}
+		if parts:
+			masks['parts'] = ~np.isin(self.num_parts, list(parts))
+		if time_signatures:
+			masks['time_signatures'] = self.not_subset(self.time_signatures, self.time_vocab, time_signatures)
+		if key_signatures:
+			masks['key_signatures'] = self.not_subset(self.key_signatures, self.key_vocab, key_signatures)
+		if pickups:
+			masks['pickups'] = self.has_pickup
+		if num_measures:
+			masks['num_measures'] = self.num_measures < num_measures
+		if note_range and note_range[0] and note_range[1]:
+			masks['note_range'] = (self.min_note < note_range[0]) | (self.max_note > note_range[1])
+		if consistent_measures:
+			masks['consistent_measures'] = ~self.consistent_measures
+		if granularity:
+			masks['granularity'] = self.granularity > granularity
+		if percent_indivisible:
+			masks['percent_indivisible'] = self.indivisible
+		if consistent_time:
+			masks['consistent_time'] = ~self.consistent_time
+		if consistent_key:
+			masks['consistent_key'] = ~self.consistent_key
+		if consistent_parts:
+			masks['consistent_parts'] = ~self.consistent_parts
+		if num_steps:
+			# nan (not exactly one time signature) never compares equal, so it is discarded too
+			masks['num_steps'] = ~(self.num_measures * self.single_ts_steps == num_steps)
+		return masks
+
+def apply_filters(table, pruning_stats, reasons=FILTER_REASONS, **filters):
+	# boolean discarded mask over table.names; fills pruning_stats with the names dropped by each filter
+	discarded = np.zeros(len(table), dtype=bool)
+	for name, mask in table.discard_masks(**filters).items():
+		pruning_stats.setdefault(reasons[name], set()).update(table.names[mask])
+		discarded |= mask
+	return discarded
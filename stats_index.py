@@ -0,0 +1,197 @@
+import zlib
+import numpy as np
+
+"""
+Inverted index of cut stats, the compact form of cumulative_score_stats.
+Every cut name gets an integer id and every (stat, value) maps to a Bitmap of
+the ids that have that value, rather than a set of name strings, so a name is
+stored once instead of once per stat. index[stat][value] still supports len(),
+so histograms read the same as before; filters are & and | of bitmaps.
+"""
+
+# number of set bits in each byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+class Bitmap(object):
+	"""
+	Set of non-negative ids as packed bits, in np.packbits order. Only the bytes
+	from the lowest to the highest id are kept, so a value held by a few
+	neighbouring cuts stays small however many cuts the index has.
+	"""
+	def __init__(self, start=0, bits=None):
+		# bits[i] holds ids 8*(start+i) to 8*(start+i)+7
+		self.start = start
+		self.bits = np.zeros(0, dtype=np.uint8) if bits is None else bits
+
+	@classmethod
+	def from_ids(cls, ids):
+		bitmap = cls()
+		bitmap.update(ids)
+		return bitmap
+
+	def end(self):
+		return self.start + len(self.bits)
+
+	def cover(self, lo, hi):
+		# grow to cover bytes lo to hi-1, doubling upwards since ids are mostly handed out in order
+		if not len(self.bits):
+			self.start = lo
+			self.bits = np.zeros(hi - lo, dtype=np.uint8)
+			return
+		start = min(lo, self.start)
+		end = self.end()
+		if hi > end:
+			end = max(hi, self.start + 2*len(self.bits))
+		if start == self.start and end == self.end():
+			return
+		bits = np.zeros(end - start, dtype=np.uint8)
+		bits[self.start-start:self.end()-start] = self.bits
+		self.start = start
+		self.bits = bits
+
+	def add(self, i):
+		self.cover(i >> 3, (i >> 3) + 1)
+		self.bits[(i >> 3) - self.start] |= 128 >> (i & 7)
+
+	def update(self, ids):
+		ids = np.asarray(ids, dtype=np.int64)
+		if not len(ids):
+			return
+		self.cover(int(ids.min()) >> 3, (int(ids.max()) >> 3) + 1)
+		np.bitwise_or.at(self.bits, (ids >> 3) - self.start, (128 >> (ids & 7)).astype(np.uint8))
+
+	def discard(self, i):
+		if i in self:
+			self.bits[(i >> 3) - self.start] ^= 128 >> (i & 7)
+
+	def __contains__(self, i):
+		return self.start <= (i >> 3) < self.end() and bool(self.bits[(i >> 3) - self.start] & (128 >> (i & 7)))
+
+	def __len__(self):
+		return int(POPCOUNT[self.bits].sum())
+
+	def ids(self):
+		return np.flatnonzero(np.unpackbits(self.bits)) + 8*self.start
+
+	def window(self, start, end):
+		# bytes start to end-1, zero where the bitmap doesn't reach
+		bits = np.zeros(end - start, dtype=np.uint8)
+		lo = max(start, self.start)
+		hi = min(end, self.end())
+		if hi > lo:
+			bits[lo-start:hi-start] = self.bits[lo-self.start:hi-self.start]
+		return bits
+
+	def __and__(self, other):
+		start = max(self.start, other.start)
+		end = min(self.end(), other.end())
+		if end <= start:
+			return Bitmap()
+		return Bitmap(start, self.window(start, end) & other.window(start, end))
+
+	def __or__(self, other):
+		if not len(other.bits):
+			return Bitmap(self.start, self.bits.copy())
+		if not len(self.bits):
+			return Bitmap(other.start, other.bits.copy())
+		start = min(self.start, other.start)
+		end = max(self.end(), other.end())
+		return Bitmap(start, self.window(start, end) | other.window(start, end))
+
+	def __getstate__(self):
+		# trim the zero bytes left by cover() and compress what's left
+		nonzero = np.flatnonzero(self.bits)
+		if not len(nonzero):
+			return (0, zlib.compress(b''))
+		bits = self.bits[nonzero[0]:nonzero[-1]+1]
+		return (self.start + int(nonzero[0]), zlib.compress(bits.tobytes()))
+
+	def __setstate__(self, state):
+		self.start = state[0]
+		self.bits = np.frombuffer(zlib.decompress(state[1]), dtype=np.uint8).copy()
+
+class StatsIndex(object):
+	def __init__(self, stats):
+		self.names = []
+		self.ids = {}
+		self.bitmaps = dict((stat, {}) for stat in stats)
+
+	@classmethod
+	def from_sets(cls, cumulative_score_stats):
+		# index of a cumulative_score_stats in the old {stat: {value: set(names)}} form
+		index = cls(cumulative_score_stats)
+		# number the cuts in name order, so a score's cuts get neighbouring ids as they do in a build
+		for name in sorted(set(name for values in cumulative_score_stats.values() for score_names in values.values() for name in score_names)):
+			index.cut_id(name)
+		for stat, values in cumulative_score_stats.items():
+			for val, score_names in values.items():
+				index.bitmaps[stat][val] = Bitmap.from_ids([index.cut_id(name) for name in score_names])
+		return index
+
+	def __getitem__(self, stat):
+		return self.bitmaps[stat]
+
+	def __iter__(self):
+		return iter(self.bitmaps)
+
+	def __contains__(self, stat):
+		return stat in self.bitmaps
+
+	def cut_id(self, name):
+		# ids are never reused, a removed cut that comes back gets its old id
+		if name not in self.ids:
+			self.ids[name] = len(self.names)
+			self.names.append(name)
+		return self.ids[name]
+
+	def add(self, name, score_stats):
+		cut_id = self.cut_id(name)
+		for stat in score_stats:
+			values = self.bitmaps[stat]
+			if score_stats[stat] not in values:
+				values[score_stats[stat]] = Bitmap()
+			values[score_stats[stat]].add(cut_id)
+
+	def remove(self, name, score_stats):
+		if name not in self.ids:
+			return
+		cut_id = self.ids[name]
+		for stat in score_stats:
+			values = self.bitmaps.get(stat)
+			if values is None or score_stats[stat] not in values:
+				continue
+			values[score_stats[stat]].discard(cut_id)
+			if not values[score_stats[stat]]:
+				del values[score_stats[stat]]
+
+	def merge(self, other):
+		id_map = np.array([self.cut_id(name) for name in other.names], dtype=np.int64)
+		for stat, values in other.bitmaps.items():
+			for val, bitmap in values.items():
+				if val not in self.bitmaps[stat]:
+					self.bitmaps[stat][val] = Bitmap()
+				self.bitmaps[stat][val].update(id_map[bitmap.ids()])
+
+	def counts(self, stat):
+		return dict((val, len(bitmap)) for val, bitmap in self.bitmaps[stat].items())
+
+	def select(self, stat, values):
+		# cuts whose stat is any of values
+		bitmap = Bitmap()
+		for val in values:
+			if val in self.bitmaps[stat]:
+				bitmap = bitmap | self.bitmaps[stat][val]
+		return bitmap
+
+	def cut_names(self, bitmap):
+		return [self.names[i] for i in bitmap.ids()]
+
+	def __getstate__(self):
+		# ids is rebuilt from names on load
+		return {'names': zlib.compress('\n'.join(self.names).encode('utf-8')), 'bitmaps': self.bitmaps}
+
+	def __setstate__(self, state):
+		names = zlib.decompress(state['names']).decode('utf-8')
+		self.names = names.split('\n') if names else []
+		self.ids = dict((name, i) for i, name in enumerate(self.names))
+		self.bitmaps = state['bitmaps']
@@ -0,0 +1,78 @@
+import os
+import json
+import math
+from html import escape
+from time import strftime
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+"""
+Headless report of cumulative_score_stats, in place of a plt.show() per stat.
+Each build gets its own directory with a bar chart PNG per stat, the counts
+behind them in stats.json and an index.html that lays them all out. Figures are
+drawn on an Agg canvas directly, so nothing opens a window or waits on one.
+"""
+REPORT_DIR = 'stats_report/'
+MAX_TICKS = 50
+
+def value_label(val):
+	if isinstance(val, frozenset):
+		return ', '.join(sorted(str(v) for v in val)) or '-'
+	if isinstance(val, float):
+		return '{:.4g}'.format(val)
+	return str(val)
+
+def stat_histogram(values):
+	# (labels, counts) sorted by value; values maps each stat value to a set of names or a Bitmap
+	keys = None
+	if not any(isinstance(val, frozenset) for val in values):
+		try:
+			keys = sorted(values, key=lambda val: (val is not None, val))
+		except TypeError:
+			pass
+	if keys is None:
+		keys = sorted(values, key=value_label)
+	return [value_label(val) for val in keys], [len(values[val]) for val in keys]
+
+def plot_histogram(labels, counts, title, path):
+	fig = Figure(figsize=(min(max(6, 0.3*len(labels)), 24), 5))
+	FigureCanvasAgg(fig)
+	ax = fig.add_subplot(111)
+	ax.bar(range(len(counts)), counts, align='center')
+	# label every bar when there's room, otherwise an evenly spaced subset
+	step = int(math.ceil(len(labels) / float(MAX_TICKS))) or 1
+	ax.set_xticks(range(0, len(labels), step))
+	ax.set_xticklabels(labels[::step], rotation=90 if len(labels) > 10 else 0, fontsize=8)
+	ax.set_title(title)
+	fig.tight_layout()
+	fig.savefig(path)
+
+def write_stats_report(cumulative_score_stats, title, pruning_stats=None, report_dir=REPORT_DIR):
+	"""
+	Writes report_dir/<time>-<title>/ with index.html, stats.json and one PNG
+	per stat, and returns the directory.
+	"""
+	out_dir = os.path.join(report_dir, strftime('%Y%m%d-%H%M%S') + '-' + title)
+	os.makedirs(out_dir, exist_ok=True)
+	report = {'title': title, 'stats': {}}
+	sections = []
+	for i, stat in enumerate(cumulative_score_stats):
+		labels, counts = stat_histogram(cumulative_score_stats[stat])
+		report['stats'][stat] = {'labels': labels, 'counts': counts}
+		section = '<h2>{}</h2>\n<p>{} values, {} cuts</p>\n'.format(escape(stat), len(counts), sum(counts))
+		if counts:
+			# stat names have % and + in them, so the images are numbered instead
+			png = 'stat_{:02d}.png'.format(i)
+			plot_histogram(labels, counts, stat, os.path.join(out_dir, png))
+			section += '<img src="{}">\n'.format(png)
+		sections.append(section)
+	if pruning_stats is not None:
+		report['pruning_stats'] = dict((reason, len(score_names)) for reason, score_names in pruning_stats.items())
+		rows = ''.join('<tr><td>{}</td><td>{}</td></tr>\n'.format(escape(reason), count) for reason, count in sorted(report['pruning_stats'].items()))
+		sections.append('<h2>pruning</h2>\n<table>\n{}</table>\n'.format(rows))
+
+	with open(os.path.join(out_dir, 'stats.json'), 'w') as f:
+		json.dump(report, f, indent=1)
+	with open(os.path.join(out_dir, 'index.html'), 'w') as f:
+		f.write('<html>\n<head><title>{0}</title></head>\n<body>\n<h1>{0}</h1>\n{1}</body>\n</html>\n'.format(escape(title), ''.join(sections)))
+	return out_dir
@@ -1,4 +1,5 @@
 import os
+import re
 import glob
 import music21
 from music21.note import Note
@@ -6,6 +7,8 @@ from music21.note import GeneralNote
 from music21.chord import Chord
 from music21.meter import TimeSignature
 from music21.key import KeySignature
+from music21.key import pitchToSharps
+from music21.interval import Interval
 from music21.note import Rest
 from music21.stream import Measure
 from music21.stream import Stream
@@ -14,12 +17,21 @@ from music21.musicxml.m21ToXml import ScoreExporter
 from music21.meter import TimeSignatureException
 from music21.duration import DurationException
 import numpy as np
-import matplotlib.pyplot as plt
 import logging
 from time import time
 from queue import Queue
 from threading import Thread
+from multiprocessing import Pool, cpu_count
 import pickle
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from score_cache import parse_score, file_hash
+from build_manifest import BuildManifest, load_pickle, remove_outputs
+from stats_index import StatsIndex
+from stats_report import write_stats_report
+from note_events import measure_index, cut_bounds, parse_xml_events, event_stats, KEY_SHIFTS
+from encoders import parse_cut_events
 
 """
 Task 1
@@ -55,6 +67,11 @@ assert MIN_PITCH == 21
 NOTE_RANGE = int(MAX_PITCH - MIN_PITCH + 1)
 GRANULARITY = 16
 STEPS_PER_CUT = 48*4
+NUM_WORKERS = cpu_count()
+# recycle workers so music21's per-process caches don't grow with the corpus
+MAX_TASKS_PER_WORKER = 20
+MANIFEST_PATH = 'manifest.p'
+CHECKPOINT_EVERY = 50
 pruning_stats = {
 	'discarded_num_measures': set(),
 	'discarded_time_signature': set(),
@@ -82,59 +99,47 @@ def midi_to_note(midi_val):
 assert midi_to_note(108) == 'C8'
 assert midi_to_note(21) == 'A0'
 
+def new_cumulative_stats():
+	return StatsIndex([
+		'composer',
+		'period',
+		'num_parts',
+		'has_pickup',
+		'num_measures',
+		'consistent_measures',
+		'min_note',
+		'max_note',
+		'granularity',
+		'divisible_notes',
+		'time_signatures',
+		'key_signatures',
+		'consistent_key',
+		'consistent_time',
+		'consistent_parts',
+		'1%+_divisible',
+		'%_indivisible'
+	])
+
 def reset_cumulative_stats():
 	global cumulative_score_stats
-	cumulative_score_stats = {
-		'composer': {},
-		'period': {},
-		'num_parts': {},
-		'has_pickup': {},
-		'num_measures': {},
-		'consistent_measures': {},
-		'min_note': {},
-		'max_note': {},
-		'granularity': {},
-		'divisible_notes': {},
-		'time_signatures': {},
-		'key_signatures': {},
-		'consistent_key': {},
-		'consistent_time': {},
-		'consistent_parts': {},
-		'1%+_divisible': {},
-		'%_indivisible': {}
-	}
+	cumulative_score_stats = new_cumulative_stats()
 
-def get_cut_score_nummeasures(score, measures_per_cut, start_i=1):
-	X_cut_score = []
-	start_ind = start_i
-	cut_score = score.measures(start_ind, start_ind+measures_per_cut-1)
-	while len(cut_score.parts[0].getElementsByClass(Measure)) == measures_per_cut:
-		X_cut_score.append(cut_score)
-		start_ind += measures_per_cut
-		cut_score = score.measures(start_ind, start_ind+measures_per_cut-1)
-	return X_cut_score
+def score_measure_index(score):
+	# one pass over the first part's measures, rather than a score.parts[0].measure(i) lookup per measure
+	measures = []
+	time_signatures = []
+	for measure in score.parts[0].getElementsByClass(Measure):
+		measures.append(measure.number)
+		if measure.timeSignature is not None:
+			time_signatures.append((measure.number, measure.timeSignature.ratioString))
+	return measure_index(measures, time_signatures)
 
-def get_cut_score_numsteps(score, steps_per_cut):
-	X_cut_score = []
-	start_ind = 1
-	i = 1
-	total_measures = len(score.parts[0].getElementsByClass(Measure))
-	ts = score.parts[0].measure(1).timeSignature
-	while i <= total_measures:
-		cur_ts = score.parts[0].measure(i).timeSignature
-		if (cur_ts and cur_ts.ratioString != ts.ratioString) or i == total_measures:
-			try:
-				cut_score = score.measures(start_ind, i-1)
-				measures_per_cut = int(steps_per_cut/(GRANULARITY*ts.beatCount*ts.beatDuration.quarterLength/4.0))
-				X_cut_score.extend(get_cut_score_nummeasures(cut_score, measures_per_cut, start_ind))
-			except TimeSignatureException:
-				print("invalid ts:", ts.ratioString)
-			ts = cur_ts
-			start_ind = i
-		i += 1
-	return X_cut_score
+def iter_cut_score_numsteps(score, steps_per_cut):
+	# the cut boundaries come from the measure index, so each cut is a single score.measures() copy
+	for start, end, _ in cut_bounds(score_measure_index(score), steps_per_cut):
+		yield score.measures(start, end)
 
-def get_score_stats(score_name, score, composer):
+def get_score_stats(score_name, score, composer, events, meta):
 	if score_name in score_to_stats:
 		return score_to_stats[score_name]
 	
@@ -151,44 +156,8 @@ def get_score_stats(score_name, score, composer):
 	# Tested
 	score_stats['consistent_measures'] = not np.any(np.diff(np.diff(sorted(score.parts[0].measureOffsetMap().keys()))))
 	
-	min_note = None
-	max_note = None
-	granularity = None
-	divisible_notes = True
-	total_notes = 0
-	indivisible_notes = 0
-	for note in score.recurse(classFilter=GeneralNote):
-		total_notes += 1
-		if note.isChord or note.isNote:
-			for pitch in note.pitches:
-				if min_note == None or pitch.midi < min_note:
-					min_note = pitch.midi
-				if max_note == None or pitch.midi > max_note:
-					max_note = pitch.midi
-		if note.quarterLength != 0:
-			note_gran = 1.0 / (0.25 * note.quarterLength)
-			if granularity == None or note_gran > granularity:
-				granularity = note_gran
-			if note.quarterLength % (4.0 / GRANULARITY) != 0:
-				indivisible_notes += 1
-				divisible_notes = False
-	# Tested
-	score_stats['min_note'] = min_note
-	# Tested
-	score_stats['max_note'] = max_note
-	# Tested
-	score_stats['granularity'] = granularity
-	# Tested
-	score_stats['divisible_notes'] = divisible_notes
-	# Tested
-	score_stats['1%+_divisible'] = indivisible_notes / total_notes < 0.01
-	# Tested
-	score_stats['%_indivisible'] = indivisible_notes / total_notes
-	
-	# Tested
-	score_stats['time_signatures'] = frozenset(ts.ratioString for ts in score.recurse(classFilter=TimeSignature))
-	# Tested
-	score_stats['key_signatures'] = frozenset(ks.getScale('major').name for ks in score.recurse(classFilter=KeySignature))
+	# the note stats come from the parsed events, without walking the music21 score
+	score_stats.update(event_stats(events, meta, GRANULARITY))
 	
 	# Tested
 	score_stats['consistent_key'] = len(score_stats['key_signatures']) == 1
@@ -199,136 +168,166 @@ def get_score_stats(score_name, score, composer):
 	
 	return score_stats
 
-def plot_statistic(stat, title):
-	plt.bar(range(len(stat)), [len(val) for val in stat.values()], align='center')
-	plt.xticks(range(len(stat)), list(stat.keys()))
-	plt.title(title)
-	plt.show()
+transposed_key_names = {}
+def transpose_key_name(key_name, shift):
+	# name of KeySignature(key_name).transpose(shift), spelled as Stream.transpose spells it
+	if shift == 0:
+		# Interval(0) respells flat keys as sharps, but the shift 0 copy is never transposed
+		return key_name
+	if (key_name, shift) not in transposed_key_names:
+		sharps = pitchToSharps(key_name.split(' ')[0], 'major')
+		transposed_key_names[(key_name, shift)] = KeySignature(sharps).transpose(Interval(shift)).getScale('major').name
+	return transposed_key_names[(key_name, shift)]
 
-def augment_score_keys(score):
-	augmented_scores = []
-	augmented_scores.append(score)
-	for k in range(1, 6):
-		aug_score1 = score.transpose(k)
-		aug_score2 = score.transpose(-k)
-		augmented_scores.append(aug_score1)
-		augmented_scores.append(aug_score2)
-	return augmented_scores
+def transpose_score_stats(score_stats, shift):
+	# stats of score.transpose(shift) from the stats of score: only pitches and keys move
+	aug_score_stats = dict(score_stats)
+	if score_stats['min_note'] is not None:
+		aug_score_stats['min_note'] = score_stats['min_note'] + shift
+		aug_score_stats['max_note'] = score_stats['max_note'] + shift
+	aug_score_stats['key_signatures'] = frozenset(transpose_key_name(key_name, shift) for key_name in score_stats['key_signatures'])
+	aug_score_stats['consistent_key'] = len(aug_score_stats['key_signatures']) == 1
+	return aug_score_stats
 
-print("Loading dataset...")
-reset_cumulative_stats()
-X_score = []
-X_score_name = []
-Y_composer = []
-ts = time()
-for composer in COMPOSERS:
-	print("Loading", composer)
-	score_names = [os.path.basename(path)[:-4] for path in glob.glob(CORPUS_DIR+composer+"/*.xml")]
-	total = len(score_names)
-	for i, score_name in enumerate(score_names):
-		if i % 10 == 0:
-			print(i, '/', total, ':', score_name)
-		try:
-			score = music21.converter.parse(CORPUS_DIR+composer+'/'+score_name+'.xml')
-			score_stats = get_score_stats(score_name, score, composer)
-			X_score.append(score)
-			X_score_name.append(score_name)
-			Y_composer.append(composer)
-			for key in score_stats:
-				if score_stats[key] in cumulative_score_stats[key]:
-					cumulative_score_stats[key][score_stats[key]].add(score_name)
-				else:
-					cumulative_score_stats[key][score_stats[key]] = set([score_name])
-			score_to_stats[score_name] = score_stats
-		except ZeroDivisionError:
-			pruning_stats['discarded_parse_error'].add(score_name)
-print('loading time {}s'.format(time() - ts))
-
-print("Partitioning dataset...")
-reset_cumulative_stats()
-X_cut_score = []
-X_cut_score_name = []
-Y_cut_composer = []
-total = len(X_score_name)
-ts = time()
-for i, score_name in enumerate(X_score_name):
-	if i % 10 == 0:
-		print(i, '/', total, ':', score_name)
-	score = X_score[i]
-	composer = Y_composer[i]
-	cut_scores = get_cut_score_numsteps(score, STEPS_PER_CUT)
-	X_cut_score.extend(cut_scores)
-	X_cut_score_name.extend([score_name+"-"+str(num) for num in range(len(cut_scores))])
-	Y_cut_composer.extend([composer for _ in range(len(cut_scores))])
-del X_score
-del X_score_name
-del Y_composer
-print('partitioning time {}s'.format(time() - ts))
+def process_score(task):
+	# PARSE -> STATS -> PARTITION -> AUGMENT -> SAVE for one source score, run in a worker process
+	composer, score_name, source_hash = task
+	result = {
+		'composer': composer,
+		'score_name': score_name,
+		'file_hash': source_hash,
+		'parse_error': False,
+		'score_stats': None,
+		'cut_names': [],
+		'aug_score_stats': {},
+		'cumulative_score_stats': new_cumulative_stats()
+	}
+	try:
+		score = parse_score(CORPUS_DIR+composer+'/'+score_name+'.xml')
+		events, meta = parse_xml_events(CORPUS_DIR+composer+'/'+score_name+'.xml')
+		result['score_stats'] = get_score_stats(score_name, score, composer, events, meta)
+	except (ZeroDivisionError, ValueError):
+		result['parse_error'] = True
+		return result
 
-print("Augmenting and Saving dataset...")
-X_aug_score = []
-X_aug_score_name = []
-Y_aug_composer = []
-total = len(X_cut_score_name)
-ts = time()
-for i, score_name in enumerate(X_cut_score_name):
-	if i % 10 == 0:
-		print(i, '/', total, ':', score_name)
-	score = X_cut_score[i]
-	composer = Y_cut_composer[i]
-	aug_scores = augment_score_keys(score)
-	aug_score_names = [score_name+"-"+str(num) for num in range(len(aug_scores))]
-	for i, aug_score in enumerate(aug_scores):
-		aug_score_name = aug_score_names[i]
+	# PARTITION -> SAVE as a stream, so only one cut is alive at a time
+	for j, cut_score in enumerate(iter_cut_score_numsteps(score, STEPS_PER_CUT)):
+		cut_name = score_name+"-"+str(j)
 		try:
-			aug_score.write('musicxml', TASK_DIR+composer+'/'+aug_score_name+'.xml')
-			score_stats = get_score_stats(aug_score_name, aug_score, composer)
-			for key in score_stats:
-				if score_stats[key] in cumulative_score_stats[key]:
-					cumulative_score_stats[key][score_stats[key]].add(aug_score_name)
-				else:
-					cumulative_score_stats[key][score_stats[key]] = set([aug_score_name])
-			score_to_stats[aug_score_name] = score_stats
+			cut_score.write('musicxml', TASK_DIR+composer+'/'+cut_name+'.xml')
+			# one parse of the written cut gives its stats and, through the encoding cache, the events encode_dataset.py encodes
+			events, meta = parse_cut_events(TASK_DIR+composer+'/'+cut_name+'.xml')
+			cut_stats = get_score_stats(cut_name, cut_score, composer, events, meta)
 		except DurationException:
 			print("unable to save:", score_name)
-# 	X_aug_score.extend(aug_scores)
-# 	X_aug_score_name.extend()
-# 	Y_aug_composer.extend([composer for _ in range(len(aug_scores))])
-del X_cut_score
-del X_cut_score_name
-del Y_cut_composer
-print('augmenting and saving time {}s'.format(time() - ts))
+			continue
+		result['cut_names'].append(cut_name)
+		# the key augmentations are only stats, encode_dataset.py transposes the cut's note events for them
+		for k, shift in enumerate(KEY_SHIFTS):
+			aug_score_name = cut_name+"-"+str(k)
+			score_stats = transpose_score_stats(cut_stats, shift)
+			result['cumulative_score_stats'].add(aug_score_name, score_stats)
+			result['aug_score_stats'][aug_score_name] = score_stats
+	del score
+	return result
+
+def build_config():
+	return {
+		'STEPS_PER_CUT': STEPS_PER_CUT,
+		'GRANULARITY': GRANULARITY,
+		'MIN_PITCH': MIN_PITCH,
+		'MAX_PITCH': MAX_PITCH,
+		'KEY_SHIFTS': KEY_SHIFTS,
+		'TASK_DIR': TASK_DIR
+	}
 
-# print("Saving dataset...")
-# total = len(X_aug_score_name)
-# ts = time()
-# for i, score_name in enumerate(X_aug_score_name):
-# 	if i % 10 == 0:
-# 		print(i, '/', total, ':', score_name)
-# 	score = X_aug_score[i]
-# 	composer = Y_aug_composer[i]
-# 	try:
-# 		score.write('musicxml', TASK_DIR+composer+'/'+score_name+'.xml')
-# 		score_stats = get_score_stats(score_name, score, composer)
-# 		for key in score_stats:
-# 			if score_stats[key] in cumulative_score_stats[key]:
-# 				cumulative_score_stats[key][score_stats[key]].add(score_name)
-# 			else:
-# 				cumulative_score_stats[key][score_stats[key]] = set([score_name])
-# 		score_to_stats[score_name] = score_stats
-# 	except DurationException:
-# 		print("unable to save:", score_name)
-# print('saving time {}s'.format(time() - ts))
+def remove_cut_files(composer, score_name, keep=()):
+	# <score_name>-<j>.xml cut files of a source on disk, other than the cuts named in keep,
+	# and any <score_name>-<j>.npy rolls older builds wrote next to them
+	cut_file = re.compile(re.escape(score_name) + r'-(\d+)\.(xml|npy)$')
+	for path in glob.glob(TASK_DIR+composer+'/'+glob.escape(score_name)+'-*'):
+		match = cut_file.match(os.path.basename(path))
+		if match and (match.group(2) == 'npy' or score_name+'-'+match.group(1) not in keep):
+			os.remove(path)
+
+def apply_result(result, manifest):
+	# swap a source's previous outputs for the ones in result and record them in the manifest
+	composer = result['composer']
+	score_name = result['score_name']
+	source = composer+'/'+score_name
+	old_outputs = manifest.outputs(source)
+	remove_outputs(score_to_stats, cumulative_score_stats, old_outputs)
+	outputs = []
+	if result['parse_error']:
+		pruning_stats['discarded_parse_error'].add(score_name)
+	else:
+		score_to_stats[score_name] = result['score_stats']
+		score_to_stats.update(result['aug_score_stats'])
+		cumulative_score_stats.merge(result['cumulative_score_stats'])
+		outputs = [score_name] + result['cut_names'] + sorted(result['aug_score_stats'])
+	# only this result's cuts keep their files, anything else is left over from an older build
+	remove_cut_files(composer, score_name, set(result['cut_names']))
+	manifest.update(source, result['file_hash'], outputs, result['parse_error'])
+
+if __name__ == '__main__':
+	print("Loading manifest...")
+	manifest = BuildManifest(MANIFEST_PATH, build_config())
+	score_to_stats = load_pickle('score_to_stats.p', {})
+	cumulative_score_stats = load_pickle('cumulative_score_stats.p', new_cumulative_stats())
+	if not isinstance(cumulative_score_stats, StatsIndex):
+		# stats pickled before the bitmap index
+		cumulative_score_stats = StatsIndex.from_sets(cumulative_score_stats)
+	stats_files = [(cumulative_score_stats, 'cumulative_score_stats.p'), (score_to_stats, 'score_to_stats.p')]
+	replayed = manifest.replay()
+	for result in replayed:
+		apply_result(result, manifest)
+	if replayed:
+		print("resumed", len(replayed), "scores from journal")
+		manifest.checkpoint(stats_files)
+
+	print("Processing dataset...")
+	tasks = []
+	sources = set()
+	for composer in COMPOSERS:
+		score_names = [os.path.basename(path)[:-4] for path in glob.glob(CORPUS_DIR+composer+"/*.xml")]
+		for score_name in score_names:
+			source = composer+'/'+score_name
+			sources.add(source)
+			source_hash = file_hash(CORPUS_DIR+source+'.xml')
+			if manifest.is_current(source, source_hash):
+				if manifest.entries[source]['parse_error']:
+					pruning_stats['discarded_parse_error'].add(score_name)
+				continue
+			# drop stale stats before forking so workers can't return them from get_score_stats
+			remove_outputs(score_to_stats, cumulative_score_stats, manifest.outputs(source))
+			tasks.append((composer, score_name, source_hash))
+	for source in manifest.sources() - sources:
+		remove_outputs(score_to_stats, cumulative_score_stats, manifest.outputs(source))
+		remove_cut_files(*source.split('/', 1))
+		manifest.remove(source)
+	total = len(tasks)
+	print(total, "new or changed scores,", len(sources) - total, "up to date")
+	ts = time()
+	pool = Pool(NUM_WORKERS, maxtasksperchild=MAX_TASKS_PER_WORKER)
+	for i, result in enumerate(pool.imap_unordered(process_score, tasks)):
+		score_name = result['score_name']
+		if i % 10 == 0:
+			print(i, '/', total, ':', score_name)
+		manifest.record(result)
+		apply_result(result, manifest)
+		if i % CHECKPOINT_EVERY == CHECKPOINT_EVERY - 1:
+			manifest.checkpoint(stats_files)
+	pool.close()
+	pool.join()
+	print('processing time {}s'.format(time() - ts))
 
-vals = sorted([val for val in cumulative_score_stats['%_indivisible']])
-for val in vals:
-	print(val, ":", len(cumulative_score_stats['%_indivisible'][val]))
+	vals = sorted([val for val in cumulative_score_stats['%_indivisible']])
+	for val in vals:
+		print(val, ":", len(cumulative_score_stats['%_indivisible'][val]))
 
-for stat in cumulative_score_stats:
-	plot_statistic(cumulative_score_stats[stat], stat)
+	print("stats report:", write_stats_report(cumulative_score_stats, 'build'))
 
-print("Pickling stats...")
-ts = time()
-pickle.dump(cumulative_score_stats, open('cumulative_score_stats.p', 'wb'))
-pickle.dump(score_to_stats, open('score_to_stats.p', 'wb'))
-print('pickling time {}s'.format(time() - ts))
\ No newline at end of file
+	print("Pickling stats...")
+	ts = time()
+	manifest.checkpoint(stats_files)
+	print('pickling time {}s'.format(time() - ts))
@@ -5,18 +5,55 @@ from __future__ import print_function
 # Imports
 import numpy as np
 import tensorflow as tf
+import os
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from note_events import augment_batch
+from batch_reader import read_rows, iter_batches, iter_windows
+from dataset_shards import ShardedDataset
+from roll_features import frame_features, FEATURE_WIDTHS
 
 
 NOTE_RANGE = 88
-STEPS_PER_CUT = 48*4
+# pyramid level to train on, in steps per whole note; cuts are 12 measures of it
+GRANULARITY = 16
+STEPS_PER_CUT = 12*GRANULARITY
+# 'roll' feeds all NOTE_RANGE pitches, 'chroma' and 'polyphony' (see roll_features) a 12 or 10 wide input
+INPUT_FEATURES = 'roll'
+INPUT_WIDTH = FEATURE_WIDTHS[INPUT_FEATURES]
+# train on every STEPS_PER_CUT window of encode_rolls.py's whole score rolls at this stride, instead of the cuts
+TRAIN_ON_WINDOWS = False
+WINDOW_STRIDE = 3*GRANULARITY
 
 tf.logging.set_verbosity(tf.logging.INFO)
 
+def batches_input_fn(batches, batch_size):
+	"""Training input from batches(), a generator of roll batches, each example randomly key shifted as it is fed."""
+	def augmented_batches():
+		for batch_x, batch_y in batches():
+			yield frame_features(augment_batch(batch_x), INPUT_FEATURES), batch_y
+	def input_fn():
+		dataset = tf.data.Dataset.from_generator(augmented_batches, (tf.float32, tf.int32), \
+				(tf.TensorShape([batch_size, STEPS_PER_CUT, INPUT_WIDTH]), tf.TensorShape([batch_size])))
+		x, y = dataset.make_one_shot_iterator().get_next()
+		return {"x": x}, y
+	return input_fn
+
+def augmented_input_fn(data, labels, inds, batch_size):
+	"""Shuffled training batches of rows inds."""
+	return batches_input_fn(lambda: iter_batches(data, labels, batch_size, inds), batch_size)
+
+def window_input_fn(rolls, roll_offsets, labels, roll_inds, batch_size):
+	"""Shuffled training batches of the overlapping windows of rolls roll_inds."""
+	return batches_input_fn(lambda: iter_windows(rolls, roll_offsets, labels, batch_size, \
+			STEPS_PER_CUT, WINDOW_STRIDE, roll_inds), batch_size)
+
 # Our application logic will be added here
 def cnn_model_fn(features, labels, mode):
 	"""Model function for CNN."""
 	# Input Layer
-	input_layer = tf.reshape(features["x"], [-1, STEPS_PER_CUT, NOTE_RANGE, 1])
+	input_layer = tf.reshape(features["x"], [-1, STEPS_PER_CUT, INPUT_WIDTH, 1])
 	
 	# Convolutional Layer #1
 	conv1 = tf.layers.conv2d(
@@ -52,10 +89,10 @@ def cnn_model_fn(features, labels, mode):
 	
 	# Pooling Layer #3
 	pool3 = tf.layers.max_pooling2d(inputs=conv3, pool_size=[2, 2], strides=2)
-	# input size reduced to (24, 11, 64)
+	# input size reduced to (24, 11, 64) for 'roll' input, (24, 1, 64) for 'chroma' and 'polyphony'
 	
 	# Dense Layer
-	pool3_flat = tf.reshape(pool3, [-1, 24*11*64]) # shape now (16896)
+	pool3_flat = tf.reshape(pool3, [-1, (STEPS_PER_CUT//8)*(INPUT_WIDTH//8)*64]) # shape now (16896) at GRANULARITY 16 for 'roll'
 	dense = tf.layers.dense(inputs=pool3_flat, units=1024, activation=tf.nn.relu) # shape now (1024)
 	dropout = tf.layers.dropout(
 		inputs=dense, rate=0.1, training=mode == tf.estimator.ModeKeys.TRAIN) # shape now (1024)
@@ -101,16 +138,15 @@ def cnn_model_fn(features, labels, mode):
 
 def main(unused_argv):
 	# Load training and eval data
-	X = np.load("X_0.npy").astype(np.float32)
-	Y = np.load("Y_0.npy").astype(np.int32)
-	train_set = np.load("train_0.p")
-	valid_set = np.load("valid_0.p")
-	test_set = np.load("test_0.p")
-	train_data = X[len(valid_set):len(valid_set)+len(train_set)]
-	train_labels = Y[len(valid_set):len(valid_set)+len(train_set)]
-	eval_data = X[:len(valid_set)]
-	eval_labels = Y[:len(valid_set)]
-	print(train_data.shape)
+	# shards are memory mapped, training batches are read from them and made float32 as they are fed
+	X = ShardedDataset("shards_0/g{}/".format(GRANULARITY))
+	Y = X.labels
+	# the shards only hold the untransposed cuts, key shifts are applied per batch
+	train_inds = X.split_inds('train')
+	train_labels = Y[train_inds]
+	eval_data = frame_features(read_rows(X, X.split_inds('valid')), INPUT_FEATURES)
+	eval_labels = Y[X.split_inds('valid')]
+	print((len(train_inds),) + X.shape[1:])
 	print(train_labels.shape)
 	print(eval_data.shape)
 	print(eval_labels.shape)
@@ -126,12 +162,18 @@ def main(unused_argv):
 		tensors=tensors_to_log, every_n_iter=100)
 	
 	# Train the model
-	train_input_fn = tf.estimator.inputs.numpy_input_fn(
-		x={"x": train_data},
-		y=train_labels,
-		batch_size=100,
-		num_epochs=None,
-		shuffle=True)
+	if TRAIN_ON_WINDOWS:
+		# whole score rolls, only those of scores whose cuts are in the train split
+		# encode_rolls.py encodes them at note_events.GRANULARITY, not per pyramid level
+		assert GRANULARITY == 16, "rolls.npy is only encoded at 16 steps per whole note"
+		rolls = np.load("rolls.npy", mmap_mode='r')
+		roll_offsets = np.load("roll_offsets.npy")
+		train_scores = set(cut_name.split('-')[0] for cut_name in X.names[train_inds])
+		roll_inds = np.flatnonzero([name in train_scores for name in np.load("roll_names.npy")])
+		print(len(roll_inds), "train score rolls")
+		train_input_fn = window_input_fn(rolls, roll_offsets, np.load("Y_rolls.npy").astype(np.int32), roll_inds, batch_size=100)
+	else:
+		train_input_fn = augmented_input_fn(X, Y, train_inds, batch_size=100)
 	mnist_classifier.train(
 		input_fn=train_input_fn,
 		steps=2000,
@@ -3,20 +3,43 @@ from __future__ import print_function
 import tensorflow as tf
 from tensorflow.contrib import rnn
 import numpy as np
+import os
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from note_events import augment_batch
+from batch_reader import read_rows, iter_batches
+from dataset_shards import ShardedDataset
+from event_tokens import roll_tokens, pad_tokens, token_lengths, bucket_batches, read_vocab, vocab_max_shift, VOCAB_FILE
+from roll_features import frame_features, FEATURE_WIDTHS
+
+# pyramid level to train on, in steps per whole note; cuts are 12 measures of it
+GRANULARITY = 16
+STEPS_PER_CUT = 12*GRANULARITY
+# 'tokens' feeds event token sequences, 'roll', 'chroma' or 'polyphony' (see roll_features) one frame per step
+INPUT_FEATURES = 'tokens'
 
 # Load training and eval data
-X = np.load("X_rnn.npy").astype(np.float32)
-Y = np.load("Y_rnn.npy").astype(np.int32)
-train_set = np.load("train_0.p")
-valid_set = np.load("valid_0.p")
-test_set = np.load("test_0.p")
-train_data = X[len(valid_set):len(valid_set)+len(train_set)]
-train_labels = Y[len(valid_set):len(valid_set)+len(train_set)]
-eval_data = X[:len(valid_set)]
-eval_labels = Y[:len(valid_set)]
-print(train_data.shape)
+# shards are memory mapped, training batches are read from them and made float32 as they are fed
+SHARD_DIR = "shards_0/g{}/".format(GRANULARITY)
+train_X = ShardedDataset(SHARD_DIR)
+train_Y = train_X.labels
+# the shards only hold the untransposed cuts, key shifts are applied per batch
+train_inds = train_X.split_inds('train')
+train_labels = train_Y[train_inds]
+eval_data = read_rows(train_X, train_X.split_inds('valid'))
+eval_labels = train_Y[train_X.split_inds('valid')]
+# cuts are fed as event token sequences, as long as they have notes rather than STEPS_PER_CUT*NOTE_RANGE
+vocab = read_vocab(SHARD_DIR + VOCAB_FILE)
+max_shift = vocab_max_shift(vocab)
+if INPUT_FEATURES == 'tokens':
+	eval_inputs, eval_lengths = pad_tokens(*roll_tokens(eval_data, max_shift))
+else:
+	eval_inputs = frame_features(eval_data, INPUT_FEATURES)
+	eval_lengths = np.full(len(eval_inputs), STEPS_PER_CUT, dtype=np.int32)
+print((len(train_inds),) + train_X.shape[1:])
 print(train_labels.shape)
-print(eval_data.shape)
+print(eval_inputs.shape)
 print(eval_labels.shape)
 print(train_labels)
 
@@ -27,42 +50,43 @@ batch_size = 128
 display_step = 200
 
 # Network Parameters
-NOTE_RANGE = 88
-STEPS_PER_CUT = 48*4
-
-num_input = NOTE_RANGE # MNIST data input (img shape: 28*28)
-timesteps = STEPS_PER_CUT # timesteps
+vocab_size = len(vocab) # event tokens, 0 pads
+num_embed = 64 # token embedding size
 num_hidden = 128 # hidden layer num of features
 num_classes = 2 # MNIST total classes (0-9 digits)
+bucket_width = 8 # batches are padded to a multiple of this many tokens
 
 # tf Graph input
-X = tf.placeholder("float", [None, timesteps, num_input])
+# token batches are as long as their longest sequence, so the time axis is left unknown
+if INPUT_FEATURES == 'tokens':
+	X = tf.placeholder(tf.int32, [None, None])
+else:
+	X = tf.placeholder("float", [None, None, FEATURE_WIDTHS[INPUT_FEATURES]])
+lengths = tf.placeholder(tf.int32, [None])
 Y = tf.placeholder("float", [None, num_classes])
 
 
 # Define weights
+embedding = tf.Variable(tf.random_normal([vocab_size, num_embed]))
 weights = {'out': tf.Variable(tf.random_normal([num_hidden, num_classes]))}
 biases = {'out': tf.Variable(tf.random_normal([num_classes]))}
 
-def RNN(x, weights, biases):
-	
-	# Prepare data shape to match `rnn` function requirements
-	# Current data input shape: (batch_size, timesteps, n_input)
-	# Required shape: 'timesteps' tensors list of shape (batch_size, n_input)
+def RNN(x, lengths, weights, biases):
 	
-	# Unstack to get a list of 'timesteps' tensors of shape (batch_size, n_input)
-	x = tf.unstack(x, timesteps, 1)
+	# (batch_size, tokens) token ids to (batch_size, tokens, num_embed)
+	if INPUT_FEATURES == 'tokens':
+		x = tf.nn.embedding_lookup(embedding, x)
 	
 	# Define a lstm cell with tensorflow
 	lstm_cell = rnn.BasicLSTMCell(num_hidden, forget_bias=1.0)
 	
-	# Get lstm cell output
-	outputs, states = rnn.static_rnn(lstm_cell, x, dtype=tf.float32)
+	# Get lstm cell output; dynamic_rnn stops each sequence at its length, so padding is never read
+	outputs, states = tf.nn.dynamic_rnn(lstm_cell, x, sequence_length=lengths, dtype=tf.float32)
 	
-	# Linear activation, using rnn inner loop last output
-	return tf.matmul(outputs[-1], weights['out']) + biases['out']
+	# Linear activation, using the output at each sequence's last token
+	return tf.matmul(states.h, weights['out']) + biases['out']
 
-logits = RNN(X, weights, biases)
+logits = RNN(X, lengths, weights, biases)
 prediction = tf.nn.softmax(logits)
 
 # Define loss and optimizer
@@ -83,39 +107,32 @@ with tf.Session() as sess:
 	
 	# Run the initializer
 	sess.run(init)
-	index_in_epoch = 0
-	num_examples = len(train_data)
-	print(train_data.shape)
-	epochs_completed = 0
+	num_examples = len(train_inds)
+	assert batch_size <= num_examples
+	batches_per_epoch = num_examples // batch_size
+	if INPUT_FEATURES == 'tokens':
+		# cuts of similar token counts batched together, in a new order every epoch, each batch read on its own
+		# and key shifted before it is tokenized
+		train_lengths = token_lengths(train_X, train_inds, max_shift)
+		print("tokens per cut", train_lengths.mean(), "max", train_lengths.max())
+		batches = bucket_batches(train_X, train_Y, batch_size, train_inds, train_lengths, max_shift, bucket_width, augment_batch)
+	else:
+		# a new permutation of train_inds every epoch, each batch key shifted before its frames are taken
+		batches = ((frame_features(augment_batch(batch_x), INPUT_FEATURES), np.full(batch_size, STEPS_PER_CUT, dtype=np.int32), batch_y) \
+				for batch_x, batch_y in iter_batches(train_X, train_Y, batch_size, train_inds))
 	
 	for step in range(1, training_steps+1):
-		start = index_in_epoch
-		index_in_epoch += batch_size
-		if index_in_epoch > num_examples:
-			epochs_completed += 1
-			print("epoch", epochs_completed)
-			perm = np.arange(num_examples)
-			np.random.shuffle(perm)
-			train_data = train_data[perm]
-			train_labels = train_labels[perm]
-			start = 0
-			index_in_epoch = batch_size
-			assert batch_size <= num_examples
-		end = index_in_epoch
-		
-		batch_x = train_data[start:end]
-		batch_y = train_labels[start:end]
-		
-		# Reshape data to get STEPS_PER_CUT seq of NOTE_RANGE elements
-		batch_x = batch_x.reshape((batch_size, timesteps, num_input))
+		if step > 1 and (step - 1) % batches_per_epoch == 0:
+			print("epoch", (step - 1) // batches_per_epoch)
+		batch_x, batch_lengths, batch_y = next(batches)
 		batch_y = np.eye(2)[batch_y]
 		batch_y = batch_y.reshape((-1, 2))
 		
 		# Run optimization op (backprop)
-		sess.run(train_op, feed_dict={X: batch_x, Y: batch_y})
+		sess.run(train_op, feed_dict={X: batch_x, lengths: batch_lengths, Y: batch_y})
 		if step % display_step == 0 or step == 1:
 			# Calculate batch loss and accuracy
-			loss, acc = sess.run([loss_op, accuracy], feed_dict={X: batch_x, Y: batch_y})
+			loss, acc = sess.run([loss_op, accuracy], feed_dict={X: batch_x, lengths: batch_lengths, Y: batch_y})
 			print("Step " + str(step) + ", Minibatch Loss= " + \
 				"{:.4f}".format(loss) + ", Training Accuracy= " + \
 				"{:.3f}".format(acc))
@@ -124,7 +141,6 @@ with tf.Session() as sess:
 	
 	# Calculate accuracy for 5 midi test files
 	test_len = 5
-	test_data = eval_data.reshape((-1, timesteps, num_input))
 	test_label = np.eye(2)[eval_labels[step % len(eval_labels)]]
 	test_label = test_label.reshape((-1, 2))
-	print("Testing Accuracy:", sess.run(accuracy, feed_dict={X: test_data, Y: test_label}))
\ No newline at end of file
+	print("Testing Accuracy:", sess.run(accuracy, feed_dict={X: eval_inputs, lengths: eval_lengths, Y: test_label}))
\ No newline at end of file
@@ -1,7 +1,7 @@
+import os
 from time import time
 import music21
 from music21.note import Note
-from music21.note import GeneralNote
 from music21.chord import Chord
 from music21.meter import TimeSignature
 from music21.key import KeySignature
@@ -10,8 +10,18 @@ from music21.stream import Measure
 from music21.stream import Stream
 import numpy as np
 import pickle
+from multiprocessing import Pool, cpu_count
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset_shards import ShardWriter, ShardedDataset
+from encoders import ENCODERS, cached_cut_events, transpose_events
+from event_tokens import write_vocab, VOCAB_FILE
+from note_events import split_aug_name, base_cuts, KEY_SHIFTS
+from note_events import roll_pyramid, FINE_GRANULARITY, PYRAMID_GRANULARITIES
 
 TASK_DIR = '/Users/faraaz/workspace/apollo/task_1/data/'
+SHARD_DIR = 'shards_0/'
 
 CORPUS_DIR = '/Users/faraaz/workspace/apollo/data/xml/'
 COMPOSERS = ['bach', 'beethoven']
@@ -34,6 +44,8 @@ assert MIN_PITCH == 21
 NOTE_RANGE = int(MAX_PITCH - MIN_PITCH + 1)
 GRANULARITY = 16
 STEPS_PER_CUT = 48*4
+FINE_STEPS_PER_CUT = STEPS_PER_CUT * FINE_GRANULARITY // GRANULARITY
+NUM_WORKERS = cpu_count()
 pruning_stats = {
 	'discarded_num_measures': set(),
 	'discarded_time_signature': set(),
@@ -58,26 +70,6 @@ def midi_to_note(midi_val):
 	note = notes[midi_val % 12]
 	return note + str(octave)
 
-def encode_score(score, num_measures, steps_per_cut, image=False):
-	if image:
-		X_score = np.zeros((steps_per_cut, NOTE_RANGE, 1))
-	else:
-		X_score = np.zeros((steps_per_cut, NOTE_RANGE))
-	steps_per_measure = steps_per_cut / num_measures
-	for note in score.recurse(classFilter=GeneralNote):
-		if (note.isChord or note.isNote) and note.quarterLength % (4.0 / GRANULARITY) == 0 :
-			for pitch in note.pitches:
-				ind = (note.measureNumber - 1) % num_measures
-				ind *= steps_per_measure
-				ind += note.offset * GRANULARITY / 4.0
-				ind = int(ind)
-				for i in range(int(note.quarterLength * GRANULARITY / 4.0)):
-					if image:
-						X_score[ind+i][pitch.midi-MIN_PITCH][0] = 1
-					else:
-						X_score[ind+i][pitch.midi-MIN_PITCH] = 1
-	return X_score
-
 def decode_score(encoding, num_measures, ts, image=False):
 	score = Stream()
 	score.timeSignature = TimeSignature(ts)
@@ -102,57 +94,108 @@ def decode_score(encoding, num_measures, ts, image=False):
 		measure_ind += 1
 	return score
 
-print("Loading sets...")
-ts = time()
-train_set = pickle.load(open('train_0.p', 'rb'))
-valid_set = pickle.load(open('valid_0.p', 'rb'))
-test_set = pickle.load(open('test_0.p', 'rb'))
-score_to_stats = pickle.load(open('score_to_stats_0.p', 'rb'))
-print('loading time {}s'.format(time() - ts))
+# any of encoders.ENCODERS
+ENCODER = 'binary'
+# 'sparse' or 'packed' shards, see dataset_shards.ShardWriter
+STORAGE = 'sparse'
+
+def level_dir(granularity):
+	return SHARD_DIR + 'g{}/'.format(granularity)
+
+def encode_cut(task):
+	"""
+	(score_name, {granularity: encoding}) of one key augmented cut, run in the
+	worker pool. The cut's note events come from the encoding cache, its key
+	augmentation is a transposition of them, and ENCODER encodes them once on the
+	FINE_GRANULARITY grid; every level of PYRAMID_GRANULARITIES is pooled from that.
+	"""
+	score_name, cut_path, num_measures = task
+	_, k = split_aug_name(score_name)
+	events = transpose_events(cached_cut_events(cut_path+'.xml'), KEY_SHIFTS[k])
+	encoded_cut = ENCODERS[ENCODER](events, num_measures, FINE_STEPS_PER_CUT, FINE_GRANULARITY)
+	return score_name, roll_pyramid(encoded_cut)
+
+def composer_label(composer):
+	return 1 if composer == 'bach' else 0
+
+def plan_encode(writers, partitions, score_to_stats):
+	"""
+	Cuts still to encode, as (tasks, splits, labels), for the split pickles
+	partitions, [(split, names)]. Every cut already in the shards first gets its
+	split and label from partitions, and cuts in none of them leave the index,
+	so a re-split never serves a cut from its old split.
+	"""
+	assigned = {}
+	tasks = []
+	task_splits = []
+	task_labels = []
+	for split, partition in partitions:
+		# key augmentation is a random shift per training batch, so only the untransposed cuts are stored
+		for score_name in sorted(base_cuts(partition)):
+			composer = score_to_stats[score_name]['composer']
+			assigned[score_name] = (split, composer_label(composer))
+			if all(score_name in writer for writer in writers.values()):
+				continue
+			cut_path = TASK_DIR+composer+'/'+split_aug_name(score_name)[0]
+			tasks.append((score_name, cut_path, score_to_stats[score_name]['num_measures']))
+			task_splits.append(split)
+			task_labels.append(composer_label(composer))
+	for writer in writers.values():
+		writer.assign(assigned)
+	return tasks, task_splits, task_labels
 
-print("Encoding dataset...")
-X_score = []
-X_score_name = []
-Y_composer = []
-ts = time()
-for partition in [valid_set, train_set, test_set]:
-	total = len(partition)
-	for i, score_name in enumerate(partition):
+if __name__ == '__main__':
+	print("Loading sets...")
+	ts = time()
+	train_set = pickle.load(open('train_0.p', 'rb'))
+	valid_set = pickle.load(open('valid_0.p', 'rb'))
+	test_set = pickle.load(open('test_0.p', 'rb'))
+	score_to_stats = pickle.load(open('score_to_stats_0.p', 'rb'))
+	print('loading time {}s'.format(time() - ts))
+
+	print("Encoding dataset...")
+	# one set of shards per pyramid level, rows are found through each level's index by name,
+	# so a restarted encode skips every cut already in a shard of every level, whatever its split now
+	writers = dict((granularity, ShardWriter(level_dir(granularity), ENCODERS[ENCODER].shape(STEPS_PER_CUT * granularity // GRANULARITY), storage=STORAGE)) \
+			for granularity in PYRAMID_GRANULARITIES)
+	tasks, task_splits, task_labels = plan_encode(writers, [('valid', valid_set), ('train', train_set), ('test', test_set)], score_to_stats)
+	total = len(tasks)
+	print(total, "cuts to encode")
+	ts = time()
+	pool = Pool(NUM_WORKERS)
+	# imap keeps the task order, so the shards come out the same however many workers there are
+	for i, (score_name, levels) in enumerate(pool.imap(encode_cut, tasks, chunksize=16)):
 		if i % 100 == 0:
-			print(i, '/', total, ':', score_name)
-		composer = score_to_stats[score_name]['composer']
-		score = music21.converter.parse(TASK_DIR+composer+'/'+score_name+'.xml')
-		encoded_score = encode_score(score, score_to_stats[score_name]['num_measures'], 192)
-		X_score.append(encoded_score)
-		X_score_name.append(score_name)
-		if composer == 'bach':
-			Y_composer.append(1)
-		else:
-			Y_composer.append(0)
-X_score = np.array(X_score)
-print(X_score.shape)
-np.save("X", X_score)
-np.save("score_names", X_score_name)
-np.save("Y", Y_composer)
-print(len(Y_composer))
-print('encoding time {}s'.format(time() - ts))
+			print(task_splits[i], i, '/', total, ':', score_name)
+		for granularity, writer in writers.items():
+			if score_name not in writer:
+				writer.add(score_name, levels[granularity], task_splits[i], task_labels[i])
+	pool.close()
+	pool.join()
+	for granularity, writer in sorted(writers.items()):
+		writer.close()
+		print(granularity, writer.index['roll_shape'], len(writer.index['names']))
+		# event token vocabulary of the level, time shifts up to a whole note
+		write_vocab(os.path.join(level_dir(granularity), VOCAB_FILE), max_shift=granularity)
+	print('encoding time {}s'.format(time() - ts))
 
-print("Decoding dataset...")
-X_score = np.load("X.npy")
-X_score_name = np.load("score_names.npy")
-Y_comppser = np.load("Y.npy")
-total = len(X_score)
-ts = time()
-for i, score in enumerate(X_score):
-	if i % 100 == 0:
-		print(i, '/', total, ':', score_name)
-	score_name = X_score_name[i]
-	composer = Y_composer[i]
-	ts = list(score_to_stats[score_name]['time_signatures'])[0]
-	num_measures = score_to_stats[score_name]['num_measures']
-	decoded_score = decode_score(score, num_measures, ts)
-	decoded_score.show()
-	break
-# print('decoding time {}s'.format(time() - ts))
+	print("Decoding dataset...")
+	X_score = ShardedDataset(level_dir(GRANULARITY))
+	X_score_name = X_score.names
+	Y_composer = X_score.labels
+	total = len(X_score)
+	ts = time()
+	for i in range(total):
+		score = X_score[i]
+		score_name = X_score_name[i]
+		if i % 100 == 0:
+			print(i, '/', total, ':', score_name)
+		composer = Y_composer[i]
+		ts = list(score_to_stats[score_name]['time_signatures'])[0]
+		num_measures = score_to_stats[score_name]['num_measures']
+		decoded_score = decode_score(score, num_measures, ts)
+		decoded_score.show()
+		break
+	# print('decoding time {}s'.format(time() - ts))
 
-print("Done.")
\ No newline at end of file
+	print("Done.")
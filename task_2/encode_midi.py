@@ -0,0 +1,75 @@
+import os
+import glob
+from time import time
+import numpy as np
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from midi_events import parse_midi_events, midi_cuts, in_note_range
+from note_events import roll_pyramid, FINE_GRANULARITY, PYRAMID_GRANULARITIES
+from encoders import ENCODERS
+from dataset_shards import ShardWriter
+from event_tokens import write_vocab, VOCAB_FILE
+
+"""
+Encodes the scraped .mid corpus straight to piano roll cuts, skipping
+midi_to_xml.sh and the music21 parse in create_dataset.py/encode_dataset.py.
+The cuts go through the same ENCODER, pyramid levels and shard format as
+encode_dataset.py, in their own SHARD_DIR.
+"""
+MIDI_DIR = '/Users/faraaz/workspace/apollo/data/midi/'
+COMPOSERS = ['mozart', 'beethoven']
+SHARD_DIR = 'shards_midi/'
+
+GRANULARITY = 16
+STEPS_PER_CUT = 48*4
+FINE_STEPS_PER_CUT = STEPS_PER_CUT * FINE_GRANULARITY // GRANULARITY
+MAX_PARTS = 4
+# any of encoders.ENCODERS
+ENCODER = 'binary'
+# 'sparse' or 'packed' shards, see dataset_shards.ShardWriter
+STORAGE = 'sparse'
+
+def level_dir(granularity):
+	return SHARD_DIR + 'g{}/'.format(granularity)
+
+def composer_label(composer):
+	return 1 if composer == 'mozart' else 0
+
+print("Encoding dataset...")
+writers = dict((granularity, ShardWriter(level_dir(granularity), ENCODERS[ENCODER].shape(STEPS_PER_CUT * granularity // GRANULARITY), storage=STORAGE)) \
+		for granularity in PYRAMID_GRANULARITIES)
+ts = time()
+for composer in COMPOSERS:
+	print("Loading", composer)
+	paths = glob.glob(MIDI_DIR+composer+"/*.mid")
+	total = len(paths)
+	for i, path in enumerate(paths):
+		score_name = os.path.basename(path)[:-4]
+		if i % 10 == 0:
+			print(i, '/', total, ':', score_name)
+		try:
+			# quantized to the finest pyramid grid, so triplets and short notes survive to be pooled
+			events, meta = parse_midi_events(path, FINE_GRANULARITY)
+		except (ValueError, IndexError):
+			print("unable to read:", score_name)
+			continue
+		if meta['num_parts'] > MAX_PARTS:
+			continue
+		for j, (_, num_measures, cut_events) in enumerate(midi_cuts(events, meta, STEPS_PER_CUT)):
+			# named like create_dataset.py's untransposed cuts, key shifts are applied per training batch
+			cut_name = score_name+"-"+str(j)+"-0"
+			if not in_note_range(cut_events) or all(cut_name in writer for writer in writers.values()):
+				continue
+			levels = roll_pyramid(ENCODERS[ENCODER](cut_events, num_measures, FINE_STEPS_PER_CUT, FINE_GRANULARITY))
+			# the MIDI corpus isn't split, every cut is stored as train
+			for granularity, writer in writers.items():
+				if cut_name not in writer:
+					writer.add(cut_name, levels[granularity], 'train', composer_label(composer))
+for granularity, writer in sorted(writers.items()):
+	writer.close()
+	print(granularity, writer.index['roll_shape'], len(writer.index['names']))
+	write_vocab(os.path.join(level_dir(granularity), VOCAB_FILE), max_shift=granularity)
+print('encoding time {}s'.format(time() - ts))
+
+print("Done.")
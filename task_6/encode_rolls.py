@@ -0,0 +1,61 @@
+import os
+import glob
+import xml.etree.ElementTree as ET
+from time import time
+import numpy as np
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from note_events import parse_xml_events, part_measure_index, encode_roll_sustain, roll_windows
+
+"""
+Encodes every corpus score once, whole, into a continuous onset/sustain roll instead of
+fixed 192 step cuts. The rolls are saved end to end in rolls.npy with
+roll_offsets.npy marking where each one starts, and training windows of any
+length and stride are numpy views into them (note_events.roll_windows and
+window_starts), so overlapping windows and tail measures cost no extra disk or
+parsing.
+"""
+CORPUS_DIR = '/Users/faraaz/workspace/apollo/data/xml/'
+COMPOSERS = ['bach', 'handel', 'beethoven', 'mozart', 'chopin', 'strauss']
+
+STEPS_PER_CUT = 48*4
+WINDOW_STRIDE = 48
+MAX_PARTS = 4
+
+print("Encoding rolls...")
+X_roll = []
+X_roll_name = []
+Y_composer = []
+ts = time()
+for composer in COMPOSERS:
+    print("Loading", composer)
+    paths = glob.glob(CORPUS_DIR+composer+"/*.xml")
+    total = len(paths)
+    for i, path in enumerate(paths):
+        score_name = os.path.basename(path)[:-4]
+        if i % 10 == 0:
+            print(i, '/', total, ':', score_name)
+        try:
+            events, meta = parse_xml_events(path)
+        except (ValueError, ET.ParseError):
+            print("unable to read:", score_name)
+            continue
+        if meta['num_parts'] == 0 or meta['num_parts'] > MAX_PARTS:
+            continue
+        X_roll.append(encode_roll_sustain(events, part_measure_index(meta)))
+        X_roll_name.append(score_name)
+        Y_composer.append(COMPOSERS.index(composer))
+roll_offsets = np.cumsum([0] + [len(roll) for roll in X_roll])
+X_roll = np.concatenate(X_roll)
+print(X_roll.shape)
+np.save("rolls", X_roll)
+np.save("roll_offsets", roll_offsets)
+np.save("roll_names", X_roll_name)
+np.save("Y_rolls", Y_composer)
+print('encoding time {}s'.format(time() - ts))
+
+num_windows = sum(len(roll_windows(X_roll[roll_offsets[i]:roll_offsets[i+1]], STEPS_PER_CUT, WINDOW_STRIDE)) for i in range(len(X_roll_name)))
+print(num_windows, "windows of", STEPS_PER_CUT, "steps at stride", WINDOW_STRIDE)
+
+print("Done.")
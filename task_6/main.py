@@ -25,6 +25,9 @@ flags.DEFINE_boolean("train", True, "True for training, False for testing [False
 flags.DEFINE_boolean("crop", False, "True for training, False for testing [False]")
 flags.DEFINE_boolean("visualize", True, "True for visualizing, False for nothing [False]")
 flags.DEFINE_integer("generate_test_images", 10, "Number of images to generate during test. [100]")
+flags.DEFINE_integer("key_shift", 5, "Largest random key shift applied to each training example, in semitones [5]")
+flags.DEFINE_integer("time_shift", 0, "Largest random time shift applied to each training example, in steps [0]")
+flags.DEFINE_integer("granularity", 16, "Pyramid level of the encoded dataset to train on, in steps per whole note; input_height and output_height are 12 measures of it [16]")
 FLAGS = flags.FLAGS
 
 def main(_):
@@ -57,6 +60,7 @@ def main(_):
           y_dim=6,
           z_dim=FLAGS.generate_test_images,
           c_dim=3,
+          granularity=FLAGS.granularity,
           dataset_name=FLAGS.dataset,
           input_fname_pattern=FLAGS.input_fname_pattern,
           crop=FLAGS.crop,
@@ -8,6 +8,12 @@ import numpy as np
 from six.moves import xrange
 
 from ops import *
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from note_events import augment_batch
+from batch_reader import read_rows, iter_batches
+from dataset_shards import ShardedDataset
 # from utils import *
 
 def conv_out_size_same(size, stride):
@@ -17,7 +23,7 @@ class DCGAN(object):
   def __init__(self, sess, input_height=192, input_width=88, crop=True,
          batch_size=64, sample_num = 64, output_height=192, output_width=88,
          y_dim=None, z_dim=100, gf_dim=64, df_dim=64,
-         gfc_dim=1024, dfc_dim=1024, c_dim=3, dataset_name='default',
+         gfc_dim=1024, dfc_dim=1024, c_dim=3, granularity=16, dataset_name='default',
          input_fname_pattern='*.jpg', checkpoint_dir=None, sample_dir=None):
     """
 
@@ -31,6 +37,7 @@ class DCGAN(object):
       gfc_dim: (optional) Dimension of gen units for for fully connected layer. [1024]
       dfc_dim: (optional) Dimension of discrim units for fully connected layer. [1024]
       c_dim: (optional) Dimension of image color. For grayscale input, set to 1. [3]
+      granularity: (optional) Pyramid level of the music dataset to load, in steps per whole note. [16]
     """
     self.sess = sess
     self.crop = crop
@@ -52,6 +59,8 @@ class DCGAN(object):
     self.gfc_dim = gfc_dim
     self.dfc_dim = dfc_dim
 
+    self.granularity = granularity
+
     # batch normalization : deals with poor initialization helps gradient flow
     self.d_bn1 = batch_norm(name='d_bn1')
     self.d_bn2 = batch_norm(name='d_bn2')
@@ -72,7 +81,7 @@ class DCGAN(object):
 
     if self.dataset_name == 'music':
       self.data_X, self.data_y = self.load_music()
-      self.c_dim = self.data_X[0].shape[-1]
+      self.c_dim = self.data_X.shape[-1]
       assert self.c_dim == 3
     else:
       self.data = glob(os.path.join("./data", self.dataset_name, self.input_fname_pattern))
@@ -162,8 +171,8 @@ class DCGAN(object):
     sample_z = np.random.uniform(-1, 1, size=(self.sample_num , self.z_dim))
     
     if config.dataset == 'music':
-      sample_inputs = self.data_X[0:self.sample_num]
-      sample_labels = self.data_y[0:self.sample_num]
+      sample_inputs = read_rows(self.data_X, self.data_perm[0:self.sample_num])
+      sample_labels = self.data_y[self.data_perm[0:self.sample_num]]
     else:
       sample_files = self.data[0:self.sample_num]
       sample = [
@@ -191,6 +200,8 @@ class DCGAN(object):
     for epoch in xrange(config.epoch):
       if config.dataset == 'music':
         batch_idxs = min(len(self.data_X), config.train_size) // config.batch_size
+        music_batches = iter_batches(self.data_X, self.data_y, config.batch_size,
+            self.data_perm[:min(len(self.data_X), config.train_size)], epochs=1)
       else:      
         self.data = glob(os.path.join(
           "./data", config.dataset, self.input_fname_pattern))
@@ -198,8 +209,9 @@ class DCGAN(object):
 
       for idx in xrange(0, batch_idxs):
         if config.dataset == 'music':
-          batch_images = self.data_X[idx*config.batch_size:(idx+1)*config.batch_size]
-          batch_labels = self.data_y[idx*config.batch_size:(idx+1)*config.batch_size]
+          # the shards hold only untransposed cuts, each batch gets its own random key shifts
+          batch_images, batch_labels = next(music_batches)
+          batch_images = augment_batch(batch_images, config.key_shift, config.time_shift)
         else:
           batch_files = self.data[idx*config.batch_size:(idx+1)*config.batch_size]
           batch = [
@@ -452,22 +464,21 @@ class DCGAN(object):
         return tf.nn.sigmoid(deconv2d(h2, [self.batch_size, s_h, s_w, self.c_dim], name='g_h3'))
 
   def load_music(self):
-    X = np.load("X_0.npy").astype(np.float32)
-    y = np.load("Y_0.npy").astype(np.int32)
+    # the shards are memory mapped and read a batch at a time, through a permutation instead of shuffling X and y in place
+    X = ShardedDataset("shards_0/g{}/".format(self.granularity))
+    y = X.labels
     print(X.shape)
+    assert X.shape[1] == self.input_height, "granularity {} rolls have {} steps".format(self.granularity, X.shape[1])
     print(y.shape)
     
     seed = 547
-    np.random.seed(seed)
-    np.random.shuffle(X)
-    np.random.seed(seed)
-    np.random.shuffle(y)
+    self.data_perm = np.random.RandomState(seed).permutation(len(X))
     
     y_vec = np.zeros((len(y), self.y_dim), dtype=np.float)
     for i, label in enumerate(y):
       y_vec[i,y[i]] = 1.0
 
-    save_music(X[0], 'base_song')
+    save_music(read_rows(X, self.data_perm[:1])[0], 'base_song')
     return X, y_vec
 
   @property
@@ -2,7 +2,11 @@ import random
 import pickle
 from time import time
 from music21.note import Note
-from music21.meter import TimeSignature
+import os
+import sys
+# the modules shared by the tasks are in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stats_filter import StatsTable, apply_filters
 
 TASK_DIR = '/Users/faraaz/workspace/apollo/task_6/data/'
 
@@ -46,61 +50,6 @@ pruning_stats = {
 NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 MAJORS = ['C', 'G', 'D', 'A', 'E', 'B', 'F#', 'C#', 'F', 'B-', 'E-', 'A-', 'D-', 'G-', 'C-']
 
-def valid_score(score_name, time_signatures=set(), pickups=False, parts=set(), note_range=[], num_measures=0, \
-	key_signatures=set(), granularity=0, consistent_measures=False, consistent_time=False, consistent_key=False, \
-	consistent_parts=False, percent_indivisible=0.0, has_key_signature=False, num_steps=0):
-		
-	score_stats = score_to_stats[score_name]
-	
-	discarded = False
-	
-	if parts and score_stats['num_parts'] not in parts:
-		discarded = True
-		pruning_stats['discarded_num_parts'].add(score_name)
-	if time_signatures and not score_stats['time_signatures'].issubset(time_signatures):
-		discarded = True
-		pruning_stats['discarded_time_signature'].add(score_name)
-	if key_signatures and not score_stats['key_signatures'].issubset(key_signatures):
-		discarded = True
-		pruning_stats['discarded_key_signature'].add(score_name)
-	if pickups and score_stats['has_pickup']:
-		discarded = True
-		pruning_stats['discarded_has_pickup'].add(score_name)
-	if num_measures and score_stats['num_measures'] < num_measures:
-		discarded = True
-		pruning_stats['discarded_num_measures'].add(score_name)
-	if note_range and note_range[0] and note_range[1] and (score_stats['min_note'] < note_range[0] or score_stats['max_note'] > note_range[1]):
-		discarded = True
-		pruning_stats['discarded_note_range'].add(score_name)
-	if consistent_measures and not score_stats['consistent_measures']:
-		discarded = True
-		pruning_stats['discarded_consistent_measures'].add(score_name)
-	if granularity and score_stats['granularity'] > granularity:
-		discarded = True
-		pruning_stats['discarded_granularity'].add(score_name)
-	if percent_indivisible and score_stats['1%+_divisible']:
-		discarded = True
-		pruning_stats['discarded_%_divisible'].add(score_name)
-	if consistent_time and not score_stats['consistent_time']:
-		discarded = True
-		pruning_stats['discarded_consistent_time'].add(score_name)
-	if consistent_key and not score_stats['consistent_key']:
-		discarded = True
-		pruning_stats['discarded_consistent_key'].add(score_name)
-	if consistent_parts and not score_stats['consistent_parts']:
-		discarded = True
-		pruning_stats['discarded_consistent_parts'].add(score_name)
-	if num_steps:
-		if len(score_stats['time_signatures']) == 1:
-			ts = TimeSignature(list(score_stats['time_signatures'])[0])
-			if num_steps != score_stats['num_measures']*(GRANULARITY*ts.beatCount*ts.beatDuration.quarterLength/4.0):
-				discarded = True
-				pruning_stats['discarded_num_steps'].add(score_name)
-		else:
-			discarded = True
-			pruning_stats['discarded_num_steps'].add(score_name)
-	return discarded
-
 print("Loading stats...")
 ts = time()
 cumulative_score_stats = pickle.load(open('cumulative_score_stats_0.p', 'rb'))
@@ -111,12 +60,14 @@ print("Splitting dataset...")
 ts = time()
 train = set()
 train_scores = set()
-for score_name in score_to_stats:
-	if not valid_score(score_name, \
-			parts=set([1, 2, 3, 4]), \
-			note_range=[MIN_PITCH, MAX_PITCH], \
-			percent_indivisible=True, \
-			num_steps=STEPS_PER_CUT):
+score_names = list(score_to_stats)
+discarded = apply_filters(StatsTable(score_to_stats, score_names), pruning_stats, \
+		parts=set([1, 2, 3, 4]), \
+		note_range=[MIN_PITCH, MAX_PITCH], \
+		percent_indivisible=True, \
+		num_steps=STEPS_PER_CUT)
+for i, score_name in enumerate(score_names):
+	if not discarded[i]:
 		continue
 	# keep augmentations or pieces from same score together
 	if '-' not in score_name:
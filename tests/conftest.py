@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the shared modules are in the repo root, the task scripts import them from there
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'task_1'))
+sys.path.insert(0, ROOT)
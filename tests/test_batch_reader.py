@@ -0,0 +1,15 @@
+import numpy as np
+from batch_reader import iter_windows
+
+def test_iter_windows_covers_the_chosen_rolls():
+	rolls = np.random.RandomState(0).randint(0, 2, (1000, 88)).astype(np.uint8)
+	roll_offsets = np.array([0, 300, 310, 1000])
+	labels = np.array([1, 0, 1])
+	starts = []
+	for batch_x, batch_y in iter_windows(rolls, roll_offsets, labels, 1, 192, 48, roll_inds=[0, 2], epochs=1):
+		assert batch_x.dtype == np.float32
+		start = [s for s in range(0, 1000 - 191) if (rolls[s:s+192] == batch_x[0]).all()][0]
+		assert batch_y[0] == (1 if start < 300 else labels[2])
+		starts.append(start)
+	# roll 1 is shorter than a window, and no window crosses into the next roll
+	assert sorted(starts) == [0, 48, 96] + list(range(310, 1000 - 191, 48))
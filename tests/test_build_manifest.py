@@ -0,0 +1,35 @@
+import os
+from build_manifest import BuildManifest
+
+CONFIG = {'STEPS_PER_CUT': 192, 'GRANULARITY': 16}
+
+def result(name):
+	return {'score_name': name, 'file_hash': name + '-hash', 'cut_names': [name + '-0', name + '-1']}
+
+def test_replay_resumes_a_crashed_build(tmp_path):
+	path = str(tmp_path / 'manifest.p')
+	manifest = BuildManifest(path, CONFIG)
+	manifest.update('bach/a', 'a-hash', ['a'])
+	manifest.checkpoint()
+	for name in ['b', 'c', 'd']:
+		manifest.record(result(name))
+	# the build dies partway through writing the last record
+	manifest.journal.close()
+	size = os.path.getsize(manifest.journal_path)
+	with open(manifest.journal_path, 'r+b') as f:
+		f.truncate(size - 5)
+
+	resumed = BuildManifest(path, CONFIG)
+	assert [r['score_name'] for r in resumed.replay()] == ['b', 'c']
+	assert resumed.is_current('bach/a', 'a-hash')
+	assert not resumed.is_current('bach/a', 'other-hash')
+	assert not BuildManifest(path, dict(CONFIG, GRANULARITY=8)).is_current('bach/a', 'a-hash')
+
+	for r in resumed.replay():
+		resumed.update('bach/' + r['score_name'], r['file_hash'], r['cut_names'])
+	resumed.checkpoint()
+	assert not os.path.exists(resumed.journal_path)
+	reloaded = BuildManifest(path, CONFIG)
+	assert reloaded.replay() == []
+	assert reloaded.sources() == {'bach/a', 'bach/b', 'bach/c'}
+	assert reloaded.outputs('bach/c') == ['c-0', 'c-1']
@@ -0,0 +1,66 @@
+from music21 import corpus
+from music21.meter import TimeSignature
+from music21.note import Note
+from music21.stream import Measure, Part, Score
+from create_dataset import get_score_stats, transpose_score_stats, score_measure_index, GRANULARITY
+from note_events import parse_xml_events, cut_bounds, KEY_SHIFTS
+
+def score_stats(name, score, tmp_path):
+	# get_score_stats of score as process_score computes it, from the MusicXML it writes
+	path = str(tmp_path / (name + '.xml'))
+	score.write('musicxml', path)
+	events, meta = parse_xml_events(path)
+	return get_score_stats(name, score, 'bach', events, meta)
+
+def test_transpose_score_stats_matches_music21_transpose(tmp_path):
+	score = corpus.parse('bach/bwv66.6')
+	stats = score_stats('bwv66.6', score, tmp_path)
+	for shift in KEY_SHIFTS:
+		# the shift 0 augmentation is the score itself, never transposed
+		transposed = score.transpose(shift) if shift else score
+		assert transpose_score_stats(stats, shift) == score_stats('bwv66.6-{}'.format(shift), transposed, tmp_path)
+
+def music21_cut_bounds(score, steps_per_cut):
+	# (first, last) measure of every cut the music21 get_cut_score_numsteps took, before cut_bounds replaced it
+	bounds = []
+	def cut_nummeasures(stretch, measures_per_cut, start_ind):
+		cut_score = stretch.measures(start_ind, start_ind+measures_per_cut-1)
+		while len(cut_score.parts[0].getElementsByClass(Measure)) == measures_per_cut:
+			measures = cut_score.parts[0].getElementsByClass(Measure)
+			bounds.append((measures[0].number, measures[-1].number))
+			start_ind += measures_per_cut
+			cut_score = stretch.measures(start_ind, start_ind+measures_per_cut-1)
+	start_ind = 1
+	total_measures = len(score.parts[0].getElementsByClass(Measure))
+	ts = score.parts[0].measure(1).timeSignature
+	for i in range(1, total_measures+1):
+		cur_ts = score.parts[0].measure(i).timeSignature
+		if (cur_ts and cur_ts.ratioString != ts.ratioString) or i == total_measures:
+			measures_per_cut = int(steps_per_cut/(GRANULARITY*ts.beatCount*ts.beatDuration.quarterLength/4.0))
+			cut_nummeasures(score.measures(start_ind, i-1), measures_per_cut, start_ind)
+			ts = cur_ts
+			start_ind = i
+	return bounds
+
+def changing_meter_score():
+	# 5 measures of 4/4, 7 of 3/4 and 6 of 4/4, a whole measure note in each
+	part = Part()
+	number = 1
+	for ratio, num_measures in [('4/4', 5), ('3/4', 7), ('4/4', 6)]:
+		for i in range(num_measures):
+			measure = Measure(number=number)
+			if i == 0:
+				measure.timeSignature = TimeSignature(ratio)
+			measure.append(Note('C4', quarterLength=TimeSignature(ratio).barDuration.quarterLength))
+			part.append(measure)
+			number += 1
+	score = Score()
+	score.insert(0, part)
+	return score
+
+def test_cut_bounds_match_music21_cuts():
+	# music21's walk only handles scores without a pickup measure
+	for score in [corpus.parse('bach/bwv10.7'), changing_meter_score()]:
+		for steps_per_cut in [32, 48, 64, 192]:
+			bounds = [(start, end) for start, end, _ in cut_bounds(score_measure_index(score), steps_per_cut)]
+			assert bounds == music21_cut_bounds(score, steps_per_cut)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from dataset_shards import ShardWriter, ShardedDataset
+
+@pytest.mark.parametrize('roll_shape', [(6, 88), (6, 88, 3)])
+def test_packed_and_sparse_shards_read_the_same(tmp_path, roll_shape):
+	rng = np.random.RandomState(0)
+	X = rng.randint(0, 2, (5,) + roll_shape).astype(np.float32)
+	if len(roll_shape) == 3:
+		# the unused channel is not stored, and a cell can be both onset and sustain
+		X[..., 0] = 0
+		X[0, 0, 0, 1:] = 1
+	data = {}
+	for storage in ('sparse', 'packed'):
+		writer = ShardWriter(str(tmp_path / storage), roll_shape, shard_size=2, storage=storage)
+		for i, roll in enumerate(X):
+			writer.add('cut-{}-0'.format(i), roll, 'train', i % 2)
+		writer.close()
+		data[storage] = ShardedDataset(str(tmp_path / storage))
+	inds = data['packed'].find(['cut-3-0', 'cut-0-0', 'cut-4-0'])
+	assert (data['packed'][inds] == X[[3, 0, 4]]).all()
+	assert (data['packed'][:] == data['sparse'][:]).all()
+	with pytest.raises(ValueError):
+		ShardWriter(str(tmp_path / 'packed'), roll_shape, storage='sparse')
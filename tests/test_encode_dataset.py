@@ -0,0 +1,31 @@
+import numpy as np
+from dataset_shards import ShardWriter, ShardedDataset
+from encode_dataset import plan_encode
+
+ROLL_SHAPE = (4, 88)
+
+def run_encode(shard_dir, partitions, score_to_stats):
+	# encode_dataset.py's main loop, with an empty roll standing in for each encoded cut
+	writers = {16: ShardWriter(shard_dir, ROLL_SHAPE, shard_size=2)}
+	tasks, task_splits, task_labels = plan_encode(writers, partitions, score_to_stats)
+	for (score_name, _, _), split, label in zip(tasks, task_splits, task_labels):
+		writers[16].add(score_name, np.zeros(ROLL_SHAPE), split, label)
+	writers[16].close()
+	return [task[0] for task in tasks]
+
+def test_resplit_moves_encoded_cuts(tmp_path):
+	shard_dir = str(tmp_path / 'g16')
+	score_to_stats = dict((name, {'composer': composer, 'num_measures': 12}) for name, composer in [
+		('a-0-0', 'bach'), ('a-1-0', 'bach'), ('b-0-0', 'beethoven'), ('c-0-0', 'beethoven'), ('d-0-0', 'bach')])
+	first = [('valid', {'a-0-0', 'a-0-1', 'a-1-0'}), ('train', {'b-0-0', 'c-0-0'}), ('test', set())]
+	assert sorted(run_encode(shard_dir, first, score_to_stats)) == ['a-0-0', 'a-1-0', 'b-0-0', 'c-0-0']
+
+	# a moves to train, b to test, c leaves every split and d is new
+	second = [('valid', set()), ('train', {'a-0-0', 'a-1-0', 'd-0-0'}), ('test', {'b-0-0'})]
+	assert run_encode(shard_dir, second, score_to_stats) == ['d-0-0']
+
+	data = ShardedDataset(shard_dir)
+	for split, partition in second:
+		assert sorted(data.names[data.split_inds(split)]) == sorted(partition)
+	assert list(data.labels[data.find(['a-0-0', 'b-0-0', 'd-0-0'])]) == [1, 0, 1]
+	assert len(data) == 4 and data[data.find(['d-0-0'])].shape == (1,) + ROLL_SHAPE
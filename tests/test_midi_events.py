@@ -0,0 +1,48 @@
+import struct
+import numpy as np
+from midi_events import parse_midi_events
+
+def varlen(value):
+	out = [value & 0x7f]
+	value >>= 7
+	while value:
+		out.insert(0, (value & 0x7f) | 0x80)
+		value >>= 7
+	return bytes(out)
+
+def write_midi(path, track_events, ticks_per_quarter=480):
+	# track_events is a list of (delta_ticks, raw event bytes)
+	track = b''.join(varlen(delta) + data for delta, data in track_events) + b'\x00\xff\x2f\x00'
+	with open(path, 'wb') as f:
+		f.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, ticks_per_quarter))
+		f.write(b'MTrk' + struct.pack('>I', len(track)) + track)
+
+def test_restruck_note_without_note_off(tmp_path):
+	path = str(tmp_path / 'restrike.mid')
+	# C4 struck twice a quarter apart with a single note_off, then E4 for a quarter
+	write_midi(path, [
+		(0, b'\x90\x3c\x40'),
+		(480, b'\x90\x3c\x40'),
+		(480, b'\x80\x3c\x00'),
+		(0, b'\x90\x40\x40'),
+		(480, b'\x80\x40\x00'),
+	])
+	events, _ = parse_midi_events(path)
+	notes = sorted((int(event['pitch']), float(event['offset']), float(event['duration'])) for event in events)
+	assert notes == [(60, 0.0, 1.0), (60, 1.0, 1.0), (64, 2.0, 1.0)]
+	assert np.all(events['duration'] <= 1.0)
+
+def test_fine_granularity_keeps_triplets(tmp_path):
+	path = str(tmp_path / 'triplets.mid')
+	# three eighth note triplets, G4 A4 B4
+	write_midi(path, [
+		(0, b'\x90\x43\x40'), (160, b'\x80\x43\x00'),
+		(0, b'\x90\x45\x40'), (160, b'\x80\x45\x00'),
+		(0, b'\x90\x47\x40'), (160, b'\x80\x47\x00'),
+	])
+	events, _ = parse_midi_events(path, 192)
+	assert np.allclose(events['offset'], [0.0, 1.0/3, 2.0/3])
+	assert np.allclose(events['duration'], 1.0/3)
+	# on the default sixteenth grid they are snapped
+	events, _ = parse_midi_events(path)
+	assert list(events['offset']) == [0.0, 0.25, 0.75]
@@ -0,0 +1,44 @@
+import numpy as np
+from note_events import NOTE_EVENT_DTYPE, FINE_GRANULARITY, PYRAMID_GRANULARITIES, roll_pyramid
+from note_events import measure_index, roll_steps, event_steps, fifths_to_key_name
+from encoders import ENCODERS
+
+def make_events(notes):
+	# notes are (measure, offset, duration, pitch), in quarters
+	events = np.zeros(len(notes), dtype=NOTE_EVENT_DTYPE)
+	for i, (measure, offset, duration, pitch) in enumerate(notes):
+		events[i] = (0, measure, offset, duration, pitch, False)
+	return events
+
+def test_pyramid_levels_equal_direct_encoding():
+	# on the eighth note grid, so every level can hold them; with a re-struck pitch,
+	# a note struck while the same pitch is held, and a note held across a measure
+	events = make_events([
+		(1, 0.0, 1.0, 60), (1, 1.0, 0.5, 60), (1, 1.5, 2.5, 64),
+		(2, 0.0, 4.0, 67), (2, 1.0, 0.5, 67), (2, 3.5, 1.5, 48),
+		(3, 0.5, 0.5, 21), (3, 2.0, 2.0, 108), (4, 0.0, 3.0, 72),
+	])
+	num_measures = 4
+	for name in ['binary', 'onset_sustain']:
+		encoder = ENCODERS[name]
+		levels = roll_pyramid(encoder(events, num_measures, num_measures*FINE_GRANULARITY, FINE_GRANULARITY))
+		for granularity in PYRAMID_GRANULARITIES:
+			direct = encoder(events, num_measures, num_measures*granularity, granularity)
+			assert levels[granularity].shape == direct.shape
+			assert np.array_equal(levels[granularity], direct), (name, granularity)
+
+def test_roll_steps_quantize_like_event_steps():
+	# durations and offsets a hair off the grid, as divisions in the MusicXML leave them
+	events = make_events([
+		(1, 0.0, 0.25 + 1e-12, 60), (1, 1.0/3 * 3 - 1e-12, 0.75 - 1e-12, 64),
+		(2, 0.5, 1.0/3, 67), (3, 2.0, 2.0, 72),
+	])
+	index = measure_index([1, 2, 3], [(1, '4/4')])
+	starts, lengths, pitches = roll_steps(events, index)
+	assert list(zip(starts, lengths, pitches)) == list(zip(*event_steps(events, 3, 16)))
+	assert list(starts) == [0, 4, 40] and list(lengths) == [1, 3, 8]
+
+def test_key_names_match_music21():
+	from music21.key import KeySignature
+	for fifths in range(-14, 15):
+		assert fifths_to_key_name(fifths) == KeySignature(fifths).getScale('major').name
@@ -0,0 +1,12 @@
+from score_cache import DiskCache
+
+def test_processes_sharing_a_cache_keep_it_bounded(tmp_path):
+	# one DiskCache per worker process, all writing to the same directory
+	max_bytes = 10000
+	caches = [DiskCache(str(tmp_path), max_bytes, check_fraction=0.1) for _ in range(4)]
+	for i in range(200):
+		caches[i % 4].put('{:04x}'.format(i), b'x' * 100)
+		assert caches[0].size() <= max_bytes + 4 * caches[0].check_bytes
+	# the most recently written entries are the ones kept
+	assert caches[0].get('{:04x}'.format(199)) is not None
+	assert caches[0].get('{:04x}'.format(0)) is None
@@ -0,0 +1,46 @@
+import pickle
+import numpy as np
+from stats_index import StatsIndex
+
+STATS = ['composer', 'num_measures', 'key_signatures']
+
+def random_stats(rng, names):
+	return dict((name, {
+		'composer': ['bach', 'beethoven'][rng.randint(2)],
+		'num_measures': int(rng.randint(8, 14)),
+		'key_signatures': frozenset(['C major', 'G major'][:rng.randint(1, 3)])
+	}) for name in names)
+
+def as_sets(index):
+	# the {stat: {value: set(names)}} form cumulative_score_stats had before the bitmap index
+	return dict((stat, dict((val, set(index.cut_names(bitmap))) for val, bitmap in index[stat].items())) for stat in index)
+
+def test_merge_and_remove_match_name_sets():
+	rng = np.random.RandomState(0)
+	score_to_stats = {}
+	index = StatsIndex(STATS)
+	# one StatsIndex per worker result, merged in as the results come back
+	for score in range(30):
+		names = ['s{}-{}-{}'.format(score, cut, k) for cut in range(3) for k in range(2)]
+		stats = random_stats(rng, names)
+		result = StatsIndex(STATS)
+		for name in names:
+			result.add(name, stats[name])
+		index.merge(result)
+		score_to_stats.update(stats)
+	# a rebuilt score drops its old outputs and brings new stats under the same names
+	for name in ['s3-0-0', 's3-0-1', 's17-2-1']:
+		index.remove(name, score_to_stats.pop(name))
+	index.add('s3-0-0', {'composer': 'beethoven', 'num_measures': 20, 'key_signatures': frozenset(['D major'])})
+	score_to_stats['s3-0-0'] = {'composer': 'beethoven', 'num_measures': 20, 'key_signatures': frozenset(['D major'])}
+
+	expected = dict((stat, {}) for stat in STATS)
+	for name, stats in score_to_stats.items():
+		for stat in STATS:
+			expected[stat].setdefault(stats[stat], set()).add(name)
+	assert as_sets(index) == expected
+	assert as_sets(pickle.loads(pickle.dumps(index))) == expected
+	assert as_sets(StatsIndex.from_sets(expected)) == expected
+	assert index.counts('num_measures')[20] == 1
+	assert set(index.cut_names(index.select('num_measures', [8, 20]))) == \
+		set(name for name, stats in score_to_stats.items() if stats['num_measures'] in (8, 20))
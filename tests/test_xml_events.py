@@ -0,0 +1,36 @@
+import music21
+import numpy as np
+from music21 import corpus
+from music21.note import GeneralNote
+from music21.meter import TimeSignature
+from music21.stream import Measure
+from note_events import parse_xml_events, encode_events, steps_per_measure, MIN_PITCH, NOTE_RANGE, GRANULARITY
+
+def music21_encode_score(score, num_measures, steps_per_cut):
+	# the music21 walk encode_dataset.py encoded cuts with before parse_xml_events replaced it
+	X_score = np.zeros((steps_per_cut, NOTE_RANGE))
+	steps_per_measure = steps_per_cut / num_measures
+	for note in score.recurse(classFilter=GeneralNote):
+		if (note.isChord or note.isNote) and note.quarterLength % (4.0 / GRANULARITY) == 0 :
+			for pitch in note.pitches:
+				ind = (note.measureNumber - 1) % num_measures
+				ind *= steps_per_measure
+				ind += note.offset * GRANULARITY / 4.0
+				ind = int(ind)
+				for i in range(int(note.quarterLength * GRANULARITY / 4.0)):
+					X_score[ind+i][pitch.midi-MIN_PITCH] = 1
+	return X_score
+
+def test_xml_events_encode_like_music21(tmp_path):
+	# a chorale with a pickup, a piano rag with two staves and chords, a quartet in 6/8
+	for name in ['bach/bwv66.6', 'joplin/maple_leaf_rag', 'schumann_robert/opus41no1/movement2']:
+		path = str(tmp_path / (name.replace('/', '_') + '.xml'))
+		corpus.parse(name).write('musicxml', path)
+		score = music21.converter.parse(path)
+		events, meta = parse_xml_events(path)
+		assert meta['num_parts'] == len(score.parts)
+		num_measures = len(score.parts[0].getElementsByClass(Measure))
+		steps_per_cut = int(num_measures * steps_per_measure(score.parts[0].recurse().getElementsByClass(TimeSignature)[0].ratioString))
+		expected = music21_encode_score(score, num_measures, steps_per_cut)
+		assert expected.any()
+		assert (encode_events(events, num_measures, steps_per_cut) == expected).all()
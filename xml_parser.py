@@ -12,12 +12,15 @@ from music21.stream import Stream
 from music21.midi import MidiFile
 from music21.musicxml.m21ToXml import ScoreExporter
 import numpy as np
-import matplotlib.pyplot as plt
 import logging
 from time import time
 # import cPickle
 from queue import Queue
 from threading import Thread
+from score_cache import parse_score
+from note_events import fill_notes
+from stats_filter import StatsTable, FILTER_REASONS, apply_filters
+from stats_report import write_stats_report
 
 CORPUS_DIR = '/Users/faraaz/workspace/apollo/data/xml/'
 COMPOSERS = ['bach', 'beethoven']
@@ -104,16 +107,17 @@ def get_cut_score(score, measures_per_cut):
 # TODO: remove dependency on midi_to_note function
 def encode_score(score):
 	X_score = np.zeros((int(MEASURES_PER_CUT * STEPS_PER_MEASURE), NOTE_RANGE))
+	starts, lengths, pitches = [], [], []
 	for note in score.recurse(classFilter=GeneralNote):
 		if (note.isChord or note.isNote) and note.quarterLength % (4.0 / GRANULARITY) == 0:
+			ind = (note.measureNumber - 1) % MEASURES_PER_CUT
+			ind *= STEPS_PER_MEASURE
+			ind += note.offset * GRANULARITY / 4.0
 			for pitch in note.pitches:
-				ind = (note.measureNumber - 1) % MEASURES_PER_CUT
-				ind *= STEPS_PER_MEASURE
-				ind += note.offset * GRANULARITY / 4.0
-				ind = int(ind)
-				for i in range(int(note.quarterLength * GRANULARITY / 4.0)):
-					X_score[ind+i][pitch.midi-MIN_PITCH] = 1
-	return X_score
+				starts.append(int(ind))
+				lengths.append(int(note.quarterLength * GRANULARITY / 4.0))
+				pitches.append(pitch.midi - MIN_PITCH)
+	return fill_notes(X_score, starts, lengths, pitches)
 
 def decode_score(encoding):
 	assert len(encoding) == MEASURES_PER_CUT * STEPS_PER_MEASURE
@@ -151,55 +155,14 @@ def prune_dataset(score_names, time_signatures=set(), pickups=False, parts=set()
 	for ks in key_signatures:
 		assert isinstance(ks, str)
 	
-	pruned_dataset = []
+	table = StatsTable(score_to_stats, score_names, indivisible_stat='1%+_indivisible')
+	reasons = dict(FILTER_REASONS, percent_indivisible='discarded_%_indivisible')
+	discarded = apply_filters(table, pruning_stats, reasons, time_signatures=time_signatures, pickups=pickups, \
+		parts=parts, note_range=note_range, num_measures=num_measures, key_signatures=key_signatures, \
+		granularity=granularity, consistent_measures=consistent_measures, consistent_time=consistent_time, \
+		consistent_key=consistent_key, consistent_parts=consistent_parts, percent_indivisible=percent_indivisible)
 	
-	for score_name in score_names:
-		assert score_name in score_to_stats
-		score_stats = score_to_stats[score_name]
-	
-		discarded = False
-		
-		if parts and score_stats['num_parts'] not in parts:
-			discarded = True
-			pruning_stats['discarded_num_parts'].add(score_name)
-		if time_signatures and not score_stats['time_signatures'].issubset(time_signatures):
-			discarded = True
-			pruning_stats['discarded_time_signature'].add(score_name)
-		if key_signatures and not score_stats['key_signatures'].issubset(key_signatures):
-			discarded = True
-			pruning_stats['discarded_key_signature'].add(score_name)
-		if pickups and score_stats['has_pickup']:
-			discarded = True
-			pruning_stats['discarded_has_pickup'].add(score_name)
-		if num_measures and score_stats['num_measures'] < num_measures:
-			discarded = True
-			pruning_stats['discarded_num_measures'].add(score_name)
-		if note_range and note_range[0] and note_range[1] and (score_stats['min_note'] < note_range[0] or score_stats['max_note'] > note_range[1]):
-			discarded = True
-			pruning_stats['discarded_note_range'].add(score_name)
-		if consistent_measures and not score_stats['consistent_measures']:
-			discarded = True
-			pruning_stats['discarded_consistent_measures'].add(score_name)
-		if granularity and score_stats['granularity'] > granularity:
-			discarded = True
-			pruning_stats['discarded_granularity'].add(score_name)
-		if percent_indivisible and score_stats['1%+_indivisible']:
-			discarded = True
-			pruning_stats['discarded_%_indivisible'].add(score_name)
-		if consistent_time and not score_stats['consistent_time']:
-			discarded = True
-			pruning_stats['discarded_consistent_time'].add(score_name)
-		if consistent_key and not score_stats['consistent_key']:
-			discarded = True
-			pruning_stats['discarded_consistent_key'].add(score_name)
-		if consistent_parts and not score_stats['consistent_parts']:
-			discarded = True
-			pruning_stats['discarded_consistent_parts'].add(score_name)
-		
-		if not discarded:
-			pruned_dataset.append(score_name)
-	
-	return pruned_dataset
+	return list(table.names[~discarded])
 
 def get_score_stats(score_name, score, composer, period):
 	if score_name in score_to_stats:
@@ -266,12 +229,6 @@ def get_score_stats(score_name, score, composer, period):
 	
 	return score_stats
 
-def plot_statistic(stat, title):
-	plt.bar(range(len(stat)), [len(val) for val in stat.values()], align='center')
-	plt.xticks(range(len(stat)), list(stat.keys()))
-	plt.title(title)
-	plt.show()
-
 class DownloadWorker(Thread):
 	def __init__(self, queue):
 		Thread.__init__(self)
@@ -346,7 +303,7 @@ for composer in COMPOSERS:
 # 			mf.read()
 # 			mf.close()
 # 			print('reading file {}s'.format(time() - ts))
-			score = music21.converter.parse(CORPUS_DIR+composer+'/'+score_name)
+			score = parse_score(CORPUS_DIR+composer+'/'+score_name)
 # 			score = music21.midi.translate.midiFileToStream(mf)
 			score_stats = get_score_stats(score_name, score, composer, COMPOSER_TO_ERA[composer])
 			X_score.append(score)
@@ -430,8 +387,7 @@ for i, score_name in enumerate(X_cut_score_name):
 	score_to_stats[score_name] = score_stats
 print('extracting time {}s'.format(time() - ts))
 
-for stat in cumulative_score_stats:
-	plot_statistic(cumulative_score_stats[stat], stat)
+print("stats report:", write_stats_report(cumulative_score_stats, 'cuts'))
 
 for val in cumulative_score_stats['time_signatures']:
 	print(val, ":", len(cumulative_score_stats['time_signatures'][val]))
@@ -478,8 +434,7 @@ del Y_cut_composer
 del Y_cut_era
 print('pruning time {}s'.format(time() - ts))
 
-for stat in cumulative_score_stats:
-	plot_statistic(cumulative_score_stats[stat], stat)
+print("stats report:", write_stats_report(cumulative_score_stats, 'pruned', pruning_stats))
 
 for stat in pruning_stats:
 	print(stat, ":", len(pruning_stats[stat]))